@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# Time to render reset emails with MIMEText and with the precompiled
+# MessageTemplate, expiry date included. Run from the source tree:
+#   PYTHONPATH=. python bench/mail_bench.py -n 10000
+
+import argparse
+import sys
+
+from ConfigParser import RawConfigParser
+from datetime import datetime, timedelta
+from pytz import timezone
+from time import time
+
+from qbic_pwresetd.mailtemplate import ExpiryDateFormatter, MessageTemplate
+
+def load_template(path):
+	c = RawConfigParser()
+	c.read(path)
+	return c.get('mail', 'default_reset_msg').decode('string_escape'), c.get('mail', 'expiry_date_format')
+
+def make_requests(count):
+	start = datetime(2016, 3, 1, 8, 0, 0)
+	return [('User %d' % i, 'user%d@example.org' % i, '%064x' % i, start + timedelta(seconds = 37 * i), 'user%d' % i)
+			for i in xrange(count)]
+
+def render_mimetext(t, tz, fmt, requests):
+	for (cn, email, secret, exp, username) in requests:
+		exp_date = exp.replace(tzinfo = timezone('UTC')).astimezone(tz).strftime(fmt)
+		t.render_mime(email, givenname = cn, secret = secret, expiry_date = exp_date, username = username)
+
+def render_compiled(t, formatter, requests):
+	for (cn, email, secret, exp, username) in requests:
+		t.render(email, givenname = cn, secret = secret, expiry_date = formatter.format(exp), username = username)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Benchmark email rendering')
+	parser.add_argument('-n', '--count', type = int, default = 10000, help = 'number of emails to render')
+	parser.add_argument('-c', '--config', default = 'cfg/qbic-ldap-pwd-resetd.ini', help = 'config file with the templates')
+	args = parser.parse_args()
+	(text, fmt) = load_template(args.config)
+	tz = timezone('Europe/Berlin')
+	t = MessageTemplate(text, 'noreply@example.org', 'Password reset link for QBiC account')
+	requests = make_requests(args.count)
+	start = time()
+	render_mimetext(t, tz, fmt, requests)
+	slow = time() - start
+	start = time()
+	render_compiled(t, ExpiryDateFormatter(tz, fmt), requests)
+	fast = time() - start
+	sys.stdout.write('%d emails\nMIMEText:        %.3fs (%.1fus/email)\nMessageTemplate: %.3fs (%.1fus/email)\nspeedup: %.1fx\n' % (
+		args.count, slow, slow * 1e6 / args.count, fast, fast * 1e6 / args.count, slow / fast))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# Throughput of pwd_score with a thread pool or a process pool of
+# increasing size. Run from the source tree:
+#   PYTHONPATH=. python bench/pwcheck_bench.py -n 2000 -w 1 2 4 8
+
+import argparse
+import sys
+
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from random import Random
+from string import ascii_letters, digits
+from time import time
+
+from qbic_pwresetd.pw_check import init_pwq_pool, pwd_score
+
+names = ['Enrico', 'Tagliavini', 'Sven', 'Nahnsen', 'Erhan', 'Kenar', 'Alice', 'Liddell']
+
+def make_cases(count):
+	rnd = Random(42)
+	cases = []
+	for i in xrange(count):
+		badwords = rnd.sample(names, 2)
+		passwd = ''.join([rnd.choice(ascii_letters + digits) for x in xrange(rnd.randint(8, 16))])
+		if rnd.random() < 0.3:
+			passwd = badwords[0] + passwd[:6]
+		cases.append((passwd, badwords))
+	return cases
+
+def score(case):
+	return pwd_score(*case)[0]
+
+def run(pool_class, workers, cases):
+	init_pwq_pool(workers)
+	pool = pool_class(workers)
+	try:
+		start = time()
+		pool.map(score, cases, chunksize = 16)
+		return time() - start
+	finally:
+		pool.close()
+		pool.join()
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Benchmark pwd_score with several workers')
+	parser.add_argument('-n', '--count', type = int, default = 2000, help = 'number of passwords to score')
+	parser.add_argument('-w', '--workers', type = int, nargs = '+', default = [1, 2, 4, 8], help = 'pool sizes to try')
+	args = parser.parse_args()
+	cases = make_cases(args.count)
+	sys.stdout.write('%-10s %8s %12s\n' % ('pool', 'workers', 'scores/s'))
+	for (name, pool_class) in (('threads', ThreadPool), ('processes', Pool)):
+		for w in args.workers:
+			elapsed = run(pool_class, w, cases)
+			sys.stdout.write('%-10s %8d %12.0f\n' % (name, w, len(cases) / elapsed))
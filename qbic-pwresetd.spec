@@ -7,7 +7,7 @@
 %define daemonuser pwadmin
 %define daemongroup pwadmin
 %define pwresetd_service qbic-pwresetd.service
-%define pwresetd_socket qbic-pwresetd.socket
+%define pwresetd_socket qbic-pwresetd.socket qbic-pwresetd-admin.socket
 
 Name:		qbic-pwresetd
 Version:	1.0.2
@@ -51,6 +51,7 @@ install -d -m 0755 ${RPM_BUILD_ROOT}%{_sbindir}
 install -d -m 0755 ${RPM_BUILD_ROOT}%{_unitdir}
 install -d -m 0750 ${RPM_BUILD_ROOT}%{_sysconfdir}/pwreset
 install -m 0644 qbic-pwresetd.socket ${RPM_BUILD_ROOT}%{_unitdir}
+install -m 0644 qbic-pwresetd-admin.socket ${RPM_BUILD_ROOT}%{_unitdir}
 install -m 0644 qbic-pwresetd.service ${RPM_BUILD_ROOT}%{_unitdir}
 mv $RPM_BUILD_ROOT/usr/bin/%{name} ${RPM_BUILD_ROOT}%{_sbindir}/%{name}
 
@@ -78,6 +79,8 @@ exit 0
 %attr(750, root, pwadmin) %{_sysconfdir}/pwreset
 %{_sbindir}/%{name}
 %{_bindir}/pwreset
+%{_bindir}/pwbreached
+%{_bindir}/pwaudit
 %{python_sitelib}/*
 %{_unitdir}/*
 
@@ -97,7 +97,14 @@ a_ack = 'ACK'
 a_nak = 'NAK'
 a_badrequest = 'BADREQUEST'
 a_error = 'ERROR'
-answer_list = [a_ack, a_nak, a_badrequest, a_error]
+# overloaded, the request was not handled and can be sent again later
+a_busy = 'BUSY'
+answer_list = [a_ack, a_nak, a_badrequest, a_error, a_busy]
+
+# GETREQUEST answers with the newest requests of the account(s) only, as
+# many as fit in the packets the client reads
+max_get_requests = 32
+max_get_request_packets = 16
 
 ####################
 ### Raw Protocol ###
@@ -0,0 +1,202 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# Background threads accept the connections, one per listening socket, and
+# queue them for the thread serving them. When too many are waiting, or one
+# waited too long, the client gets a BUSY answer right away instead of
+# timing out. With several sockets the next connection is picked by stride
+# scheduling: each socket gets a share of the turns proportional to its
+# weight, as long as it has connections waiting
+
+import errno
+import fcntl
+import os
+import select
+import socket
+import struct
+
+from Queue import Queue
+from threading import Thread
+from time import sleep, time
+
+from . import ProtocolError, a_busy, readpackets, sendpackets
+from .metrics import registry as metrics
+
+busy_message = 'Server busy, try again later'
+timeval_t = struct.Struct('2Q')
+
+class _Listener(object):
+
+	def __init__(self, name, listen_socket, weight):
+		self.name = name
+		self.socket = listen_socket
+		# unbounded, the acceptor checks the depth itself: it can change
+		# while connections are waiting, and a Queue only notices when
+		# qsize() is exactly maxsize
+		self.queue = Queue()
+		self.weight = weight
+		# virtual time of its next turn, grows by 1 / weight per turn taken
+		self.pass_ = 0.0
+		self.thread = None
+
+class Admission(object):
+
+	def __init__(self, depth, max_wait, warn = None):
+		# connections waiting to be served per socket, not counting the one being served
+		self.depth = depth
+		# seconds, older connections are shed when their turn comes
+		self.max_wait = max_wait
+		# called with a message when accepting fails
+		self._warn = warn
+		self.listeners = []
+		self._vtime = 0.0
+		self._stopping = False
+		# one byte per connection queued, the server blocks reading them.
+		# Used as signal wakeup fd too, a signal delivered to the accepting
+		# thread must wake up the server to be handled
+		(self._wake_r, self._wake_w) = os.pipe()
+		fl = fcntl.fcntl(self._wake_w, fcntl.F_GETFL)
+		fcntl.fcntl(self._wake_w, fcntl.F_SETFL, fl | os.O_NONBLOCK)
+
+	def wakeup_fd(self):
+		return self._wake_w
+
+	def add_listener(self, name, listen_socket, weight = 1):
+		self.listeners.append(_Listener(name, listen_socket, weight))
+		return
+
+	def set_depth(self, depth):
+		"""
+		takes effect with the next connection accepted, the ones waiting
+		already beyond a smaller depth are still served
+		"""
+		self.depth = depth
+		return
+
+	def set_weights(self, weights, default = 1):
+		"""weights maps socket names to weights, default for the others"""
+		for l in self.listeners:
+			l.weight = weights.get(l.name, default)
+		return
+
+	def start(self):
+		self._stopping = False
+		for l in self.listeners:
+			l.thread = Thread(target = self._run, args = (l,), name = 'acceptor-%s' % l.name)
+			l.thread.daemon = True
+			l.thread.start()
+		return
+
+	def stop(self):
+		self._stopping = True
+		return
+
+	def _wake(self):
+		try:
+			os.write(self._wake_w, 'c')
+		except OSError as e:
+			# pipe full, the server has plenty to wake up for already
+			if e.errno not in [errno.EAGAIN, errno.EWOULDBLOCK]:
+				raise
+		return
+
+	def _run(self, listener):
+		while not self._stopping:
+			try:
+				(conn, address) = listener.socket.accept()
+			except socket.error as e:
+				if e.errno in [errno.EINTR, errno.ECONNABORTED]:
+					continue
+				if self._stopping:
+					return
+				if self._warn is not None:
+					self._warn('Error accepting a connection on %s: %s' % (listener.name, str(e)))
+				# e.g. out of file descriptors, don't spin
+				sleep(0.1)
+				continue
+			# only this thread puts in this queue, it can only get shorter
+			# until the put
+			if listener.queue.qsize() >= self.depth:
+				shed(conn, 'queue_full', listener.name)
+				continue
+			listener.queue.put_nowait((conn, address, time()))
+			self._wake()
+
+	def _take(self):
+		# only the serving thread takes from the queues, what's not empty stays so
+		ready = [l for l in self.listeners if not l.queue.empty()]
+		if len(ready) == 0:
+			return None
+		for l in ready:
+			# who was idle doesn't get to make up for the turns it didn't need
+			l.pass_ = max(l.pass_, self._vtime)
+		l = min(ready, key = lambda x: x.pass_)
+		self._vtime = l.pass_
+		l.pass_ += 1.0 / l.weight
+		return (l, l.queue.get_nowait())
+
+	def get(self, timeout = None):
+		"""
+		The next connection to serve as (conn, address, socket name), blocks
+		until there is one or for timeout seconds. Returns None when woken up
+		by a signal, after the timeout, or when the one picked waited too
+		long and was shed
+		"""
+		item = self._take()
+		if item is None:
+			try:
+				(readable, w, x) = select.select([self._wake_r], [], [], timeout)
+				if len(readable) == 0:
+					return None
+				os.read(self._wake_r, 512)
+			except (OSError, select.error) as e:
+				if e.args[0] == errno.EINTR:
+					return None
+				raise
+			item = self._take()
+			if item is None:
+				return None
+		(listener, (conn, address, queued)) = item
+		waited = time() - queued
+		metrics.observe('pwresetd_admission_wait_seconds', waited, socket = listener.name)
+		if self.max_wait and waited > self.max_wait:
+			shed(conn, 'queue_timeout', listener.name)
+			return None
+		return (conn, address, listener.name)
+
+def shed(conn, reason, socket_name, timeout = 0.5):
+	"""Answer BUSY and close, without waiting long for a slow client"""
+	metrics.inc('pwresetd_shed_total', reason = reason, socket = socket_name)
+	try:
+		t = timeval_t.pack(int(timeout), int((timeout % 1) * 1000000))
+		conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, t)
+		conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, t)
+		# read the request first, closing with it unread might fail the
+		# client while still sending it, before it reads the answer
+		readpackets(conn)
+		sendpackets(conn, '%s %s' % (a_busy, busy_message))
+	except (socket.error, ProtocolError):
+		pass
+	finally:
+		conn.close()
+	return
@@ -0,0 +1,121 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# Score many passwords with pwd_score to see how a password policy would
+# treat them. Only aggregated counts are kept, never the passwords
+
+from collections import Counter, deque
+from itertools import islice
+from multiprocessing import Pool
+
+from .pw_check import init_breached_index, pwd_score
+
+class AuditResult(object):
+
+	def __init__(self):
+		self.total = 0
+		# int(score) -> number of passwords, -1 for the ones refused by pwquality
+		self.scores = Counter()
+		self.reasons = Counter()
+
+	def update(self, other):
+		self.total += other.total
+		self.scores.update(other.scores)
+		self.reasons.update(other.reasons)
+		return
+
+	def accepted(self, min_score):
+		return sum([n for (s, n) in self.scores.iteritems() if s >= min_score])
+
+def parse_line(line):
+	"""
+	Lines are the password, a tab and the names of the user separated by
+	spaces. Returns (password, names) or None for empty lines
+	"""
+	line = line.rstrip('\r\n')
+	if line == '':
+		return None
+	(passwd, sep, names) = line.partition('\t')
+	return (passwd, names.split())
+
+def score_lines(lines):
+	res = AuditResult()
+	for l in lines:
+		p = parse_line(l)
+		if p is None:
+			continue
+		(score, reason) = pwd_score(*p)
+		res.total += 1
+		res.scores[int(score)] += 1
+		if reason is not None:
+			res.reasons[str(reason)] += 1
+	return res
+
+def _init_worker(breached_index_path):
+	if breached_index_path is not None:
+		init_breached_index(breached_index_path)
+	return
+
+def audit(lines, workers = 4, chunk_size = 1000, breached_index_path = None):
+	"""
+	Score lines with a pool of worker processes. At most 2 * workers chunks
+	are read ahead, so memory use doesn't depend on the number of lines
+	"""
+	res = AuditResult()
+	pool = Pool(workers, _init_worker, (breached_index_path,))
+	try:
+		lines = iter(lines)
+		pending = deque()
+		while True:
+			chunk = list(islice(lines, chunk_size))
+			if len(chunk) > 0:
+				pending.append(pool.apply_async(score_lines, (chunk,)))
+			if len(pending) > 0 and (len(pending) >= 2 * workers or len(chunk) == 0):
+				res.update(pending.popleft().get())
+			elif len(chunk) == 0:
+				break
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+	return res
+
+def format_report(res, min_scores, width = 50):
+	lines = ['%d passwords' % res.total, '', 'score histogram:']
+	top = max(res.scores.values() or [0])
+	for s in sorted(res.scores):
+		n = res.scores[s]
+		label = 'refused' if s < 0 else str(s)
+		lines.append('%8s %10d %s' % (label, n, '#' * (n * width // top)))
+	lines += ['', 'rejection reasons:']
+	for (reason, n) in res.reasons.most_common():
+		lines.append('%10d %s' % (n, reason))
+	lines += ['', 'acceptance:']
+	for m in min_scores:
+		a = res.accepted(m)
+		lines.append('  min_score = %d: %d accepted, %d rejected (%.1f%% accepted)' % (
+			m, a, res.total - a, 100.0 * a / res.total if res.total > 0 else 0
+		))
+	return '\n'.join(lines) + '\n'
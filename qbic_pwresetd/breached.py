@@ -0,0 +1,171 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# Index of breached password hashes, as published for example by Have I
+# Been Pwned. File layout:
+#   header: magic, number of records
+#   prefix table: 65537 record numbers, entry p is the first record whose
+#     hash starts with the 16 bit value p, the last one is the record count
+#   records: the SHA1 digests, 20 bytes each, sorted and unique
+# A lookup reads two table entries and binary searches the few records
+# in between, directly from the memory mapped file.
+
+import heapq
+import mmap
+import os
+import struct
+
+from binascii import unhexlify
+from hashlib import sha1
+from tempfile import TemporaryFile
+
+index_magic = 'QBPWBRH1'
+header_t = struct.Struct('<8sQ')
+prefix_t = struct.Struct('>H')
+record_size = sha1().digest_size
+prefix_count = 1 << (8 * prefix_t.size)
+table_t = struct.Struct('<%dQ' % (prefix_count + 1))
+# two consecutive table entries, the range of records of one prefix
+bucket_t = struct.Struct('<QQ')
+
+def parse_hash_line(line):
+	"""
+	Digest from a line of the hash list. Lines are the hex SHA1, optionally
+	followed by : and the number of times it was seen. Returns None for
+	empty lines and comments
+	"""
+	line = line.strip()
+	if line == '' or line.startswith('#'):
+		return None
+	digest = unhexlify(line.split(':', 1)[0])
+	if len(digest) != record_size:
+		raise ValueError('Not a SHA1 hash: %s' % line)
+	return digest
+
+def _read_records(f):
+	f.seek(0)
+	while True:
+		r = f.read(record_size)
+		if len(r) < record_size:
+			return
+		yield r
+
+def _sorted_chunk(digests):
+	f = TemporaryFile(prefix = 'pwbreached')
+	digests.sort()
+	f.write(''.join(digests))
+	return f
+
+def build_index(lines, path, chunk_size = 1 << 22):
+	"""
+	Write the index for the hash list lines to path. The list doesn't need
+	to fit in memory: chunk_size hashes at a time are sorted to temporary
+	files, which are then merged. Returns the number of unique hashes
+	"""
+	chunks = []
+	try:
+		digests = []
+		for line in lines:
+			d = parse_hash_line(line)
+			if d is None:
+				continue
+			digests.append(d)
+			if len(digests) >= chunk_size:
+				chunks.append(_sorted_chunk(digests))
+				digests = []
+		if len(digests) > 0:
+			chunks.append(_sorted_chunk(digests))
+		del digests
+		table = [0] * (prefix_count + 1)
+		count = 0
+		tmp_path = path + '.tmp'
+		with open(tmp_path, 'wb') as out:
+			# header and table are written again once known
+			out.write('\0' * (header_t.size + table_t.size))
+			last = None
+			for d in heapq.merge(*[_read_records(x) for x in chunks]):
+				if d == last:
+					continue
+				out.write(d)
+				table[prefix_t.unpack(d[:prefix_t.size])[0] + 1] += 1
+				last = d
+				count += 1
+			# turn the counts per prefix into the first record of each prefix
+			for p in xrange(1, prefix_count + 1):
+				table[p] += table[p - 1]
+			out.seek(0)
+			out.write(header_t.pack(index_magic, count))
+			out.write(table_t.pack(*table))
+		os.rename(tmp_path, path)
+	finally:
+		for f in chunks:
+			f.close()
+	return count
+
+class BreachedIndex(object):
+
+	"""Read only view of an index written by build_index"""
+
+	def __init__(self, path):
+		self.path = path
+		with open(path, 'rb') as f:
+			self._map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+		try:
+			if len(self._map) < header_t.size + table_t.size:
+				raise ValueError('%s is too short to be a breached password index' % path)
+			(magic, self.count) = header_t.unpack(self._map[:header_t.size])
+			if magic != index_magic:
+				raise ValueError('%s is not a breached password index' % path)
+			if len(self._map) != header_t.size + table_t.size + self.count * record_size:
+				raise ValueError('%s is truncated or corrupted' % path)
+		except:
+			self._map.close()
+			raise
+		self._records = header_t.size + table_t.size
+
+	def __len__(self):
+		return self.count
+
+	def contains_digest(self, digest):
+		p = prefix_t.unpack(digest[:prefix_t.size])[0]
+		(lo, hi) = bucket_t.unpack_from(self._map, header_t.size + p * 8)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			start = self._records + mid * record_size
+			r = self._map[start:start + record_size]
+			if r < digest:
+				lo = mid + 1
+			elif r > digest:
+				hi = mid
+			else:
+				return True
+		return False
+
+	def __contains__(self, passwd):
+		if isinstance(passwd, unicode):
+			passwd = passwd.encode('utf-8')
+		return self.contains_digest(sha1(passwd).digest())
+
+	def close(self):
+		self._map.close()
+		return
@@ -23,8 +23,8 @@ __author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
 
 import struct
 
-from . import readpackets, sendpackets, BadAnswer, a_ack, a_nak, a_badrequest, a_error, answer_list
-from . import crta_t, unpack_uint, uint_t
+from . import readpackets, sendpackets, BadAnswer, a_ack, a_nak, a_badrequest, a_error, a_busy, answer_list
+from . import crta_t, max_get_request_packets, unpack_uint, uint_t
 from .resetrequest import ResetRequest
 from base64 import standard_b64encode, standard_b64decode
 
@@ -32,6 +32,11 @@ from base64 import standard_b64encode, standard_b64decode
 def _send_create_request(useroremail, secret, duration, enabled):
 	return '%s %s %s' % (useroremail, secret, crta_t.pack(duration, enabled))
 
+def _send_get_request(selector):
+	if selector.startswith('email='):
+		return 'email=' + standard_b64encode(selector.split('=', 1)[1])
+	return selector
+
 def _send_list_requests(limit):
 	return uint_t.pack(limit)
 
@@ -50,14 +55,18 @@ def _send_send_email(msg_type, secrets):
 #			ret.append(secret)
 	return ' '.join([msg_type.upper()] + secrets)
 
+def _send_profile(*args):
+	return ' '.join([str(x) for x in args])
+
 _cmd2send = {
 	'CREATEREQUEST': (_send_create_request, 4),
-#	'GETREQUEST': (_send_get_request, 1),  # Not implemented yet
+	'GETREQUEST': (_send_get_request, 1),
 	'LISTREQUESTS': (_send_list_requests, 1),
 	'RESETPW': (_send_reset_password, 3),
 	'ENABLEREQUEST': (_send_enable_request, 1),
 	'DISABLEREQUEST': (_send_enable_request, 1),
 	'SENDEMAIL': (_send_send_email, '?'),
+	'PROFILE': (_send_profile, '?'),
 }
 def send_request(conn, cmd, args):
 	if cmd not in _cmd2send:
@@ -124,16 +133,23 @@ def _parse_answer_send_email(args):
 
 _cmd2parse_answer = {
 	'CREATEREQUEST': (_parse_simple_answer, []),
-#	'GETREQUEST': (_parse_answer_get_request, []),  # Not implemented yet
+	'GETREQUEST': (_parse_answer_list_requests, [a_ack]),
 	'LISTREQUESTS': (_parse_answer_list_requests, [a_ack]),
 	'RESETPW': (_parse_simple_answer, []),
 	'ENABLEREQUEST': (_parse_answer_enable_request, [a_ack]),
 	'DISABLEREQUEST': (_parse_answer_enable_request, [a_ack]),
 	'SENDEMAIL': (_parse_answer_send_email, [a_ack, a_nak]),
 	'TESTPROTOCOL': (_parse_simple_answer, []),
+	'STATS': (_parse_simple_answer, []),
+	'PROFILE': (_parse_simple_answer, []),
+}
+# answers that can be longer than the default 4 packets
+_cmd2maxpackets = {
+	'STATS': 256,
+	'GETREQUEST': max_get_request_packets,
 }
 def get_answer(conn, cmd):
-	line = readpackets(conn)
+	line = readpackets(conn, _cmd2maxpackets.get(cmd, 4))
 	if line is None:
 		raise BadAnswer('Empty answer')
 	try:
@@ -21,10 +21,20 @@
 
 __author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
 
+import ldap
+import re
+
 from . import config, ArgumentError
+from .qbicldap import LDAPResult
+from base64 import standard_b64decode
+from ldap.filter import filter_format
+from time import sleep, time
+from urlparse import parse_qs
 
 reader_ldap = None
 pwadmin_ldap = None
+# seconds every search takes, to look like a remote server
+latency = 0
 
 example_user = {
 	'uid': ['qbcldaptest'],
@@ -41,20 +51,131 @@ example_user = {
 	'userPassword': ['invalid password hash'],
 }
 
+class FakeEntry(object):
+
+	"""One directory entry. Attribute names are matched ignoring case, like LDAP does"""
+
+	__slots__ = ('dn', 'attrs', 'names')
+
+	def __init__(self, dn, attrs):
+		self.dn = dn
+		self.attrs = attrs
+		self.names = dict([(x.lower(), x) for x in attrs])
+
+	def get(self, name):
+		return self.attrs.get(self.names.get(name, name), [])
+
+# DN -> FakeEntry
 fake_ldap_users = {}
+# attribute -> lower case value -> set of DNs. Equality filters on these
+# attributes don't need to look at every entry
+indexed_attrs = ('uid', 'mail')
+fake_ldap_indexes = dict([(x, {}) for x in indexed_attrs])
+
+def add_fake_entry(dn, attrs):
+	if dn in fake_ldap_users:
+		remove_fake_entry(dn)
+	entry = FakeEntry(dn, attrs)
+	fake_ldap_users[dn] = entry
+	for a in indexed_attrs:
+		for v in entry.get(a):
+			fake_ldap_indexes[a].setdefault(v.lower(), set()).add(dn)
+	return
+
+def remove_fake_entry(dn):
+	entry = fake_ldap_users.pop(dn)
+	for a in indexed_attrs:
+		for v in entry.get(a):
+			dns = fake_ldap_indexes[a][v.lower()]
+			dns.discard(dn)
+			if len(dns) == 0:
+				del fake_ldap_indexes[a][v.lower()]
+	return
 
 def add_fake_user(**kwargs):
-	fake_ldap_users[kwargs['uid'][0]] = kwargs
-
-def init_ldap(qbic_luri, pwadmin_bdn, pwadmin_bpwd, reader_bdn, reader_bpwd, qbic_lbase, qbic_ubase):
-	#global qbic_ldap_uri, pwadmin_bind_dn, pwadmin_bind_pwd, reader_bind_dn, reader_bind_pwd, qbic_ldap_base, qbic_user_base
-	#qbic_ldap_uri = qbic_luri
-	#pwadmin_bind_dn = pwadmin_bdn
-	#pwadmin_bind_pwd = pwadmin_bpwd
-	#reader_bind_dn = reader_bdn
-	#reader_bind_pwd = reader_bpwd
-	#qbic_ldap_base = qbic_lbase
-	#qbic_user_base = qbic_ubase
+	add_fake_entry('uid=%s,ou=people' % kwargs['uid'][0], kwargs)
+
+def clear_fake_users():
+	fake_ldap_users.clear()
+	for a in indexed_attrs:
+		fake_ldap_indexes[a].clear()
+	return
+
+def parse_ldif(f):
+	"""
+	Generator yielding (dn, attrs) for every entry of the LDIF file object f.
+	Only content records are supported, no change records or URL values
+	"""
+	dn = None
+	attrs = {}
+	line = None
+	for l in f:
+		l = l.rstrip('\r\n')
+		if l.startswith(' '):
+			# continuation of the previous line
+			line += l[1:]
+			continue
+		if line is not None:
+			(dn, attrs) = _parse_ldif_line(line, dn, attrs)
+			line = None
+		if l.startswith('#'):
+			continue
+		if l == '':
+			if dn is not None:
+				yield (dn, attrs)
+			(dn, attrs) = (None, {})
+			continue
+		line = l
+	if line is not None:
+		(dn, attrs) = _parse_ldif_line(line, dn, attrs)
+	if dn is not None:
+		yield (dn, attrs)
+	return
+
+def _parse_ldif_line(line, dn, attrs):
+	(name, value) = line.split(':', 1)
+	if value.startswith(':'):
+		value = standard_b64decode(value[1:].strip())
+	elif value.startswith('<'):
+		raise ValueError('URL values are not supported in LDIF: %s' % line)
+	else:
+		value = value.lstrip(' ')
+	if dn is None:
+		if name.lower() == 'version':
+			return (dn, attrs)
+		if name.lower() != 'dn':
+			raise ValueError('LDIF entry must start with dn, got %s' % line)
+		return (value, attrs)
+	attrs.setdefault(name, []).append(value)
+	return (dn, attrs)
+
+def load_ldif(path):
+	"""add all the entries of the LDIF file at path, returns how many"""
+	count = 0
+	with open(path) as f:
+		for (dn, attrs) in parse_ldif(f):
+			add_fake_entry(dn, attrs)
+			count += 1
+	return count
+
+def init_ldap(qbic_luri, *args):
+	"""
+	qbic_luri is `fakeldap' for the built in example user only or
+	fakeldap:///path/to/users.ldif to load a directory from file. The
+	query string can set a latency in seconds for every search, for example
+	fakeldap:///path/to/users.ldif?latency=0.05
+	"""
+	global latency
+	(path, sep, query) = qbic_luri.partition(':')[2].partition('?')
+	if path.startswith('//'):
+		path = path[2:]
+	latency = float(parse_qs(query).get('latency', ['0'])[0])
+	clear_fake_users()
+	if path == '':
+		# put some data in the DB
+		add_fake_user(**example_user)
+	else:
+		load_ldif(path)
 	return
 
 def connect_reader_ldap():
@@ -67,17 +188,140 @@ def disconnect_ldap():
 	return
 
 def get_account_attrs(search_filter, attrs):
-	search_filter = search_filter.strip('()')
-	# just trivial filters are supported
-	(attribute, value) = search_filter.split('=', 1)
+	return [args for (dn, args) in search_accounts(search_filter, attrs)]
+
+_filter_escape_re = re.compile(r'\\([0-9a-fA-F]{2})')
+
+def _unescape(value):
+	return _filter_escape_re.sub(lambda m: chr(int(m.group(1), 16)), value)
+
+def parse_filter(search_filter):
+	"""
+	Turn an LDAP filter string into a tree of tuples: ('&', [...]), ('|', [...]),
+	('!', node), ('=', attr, value) and ('*', attr, regex) for presence and
+	substring matches. Names and values are lower case
+	"""
+	if not search_filter.startswith('('):
+		search_filter = '(' + search_filter + ')'
+	(node, pos) = _parse_filter(search_filter, 0)
+	if pos != len(search_filter):
+		raise ValueError('Trailing characters in LDAP filter %s' % search_filter)
+	return node
+
+def _parse_filter(s, pos):
+	if s[pos:pos + 1] != '(':
+		raise ValueError('Expected ( at position %d in LDAP filter %s' % (pos, s))
+	pos += 1
+	op = s[pos:pos + 1]
+	if op in ('&', '|', '!'):
+		pos += 1
+		children = []
+		while s[pos:pos + 1] == '(':
+			(child, pos) = _parse_filter(s, pos)
+			children.append(child)
+		if s[pos:pos + 1] != ')' or (op == '!' and len(children) != 1):
+			raise ValueError('Malformed %s expression in LDAP filter %s' % (op, s))
+		if op == '!':
+			return (('!', children[0]), pos + 1)
+		return ((op, children), pos + 1)
+	end = s.find(')', pos)
+	if end < 0 or '=' not in s[pos:end]:
+		raise ValueError('Malformed item in LDAP filter %s' % s)
+	(attr, value) = s[pos:end].split('=', 1)
+	if attr[-1:] in ('<', '>', '~'):
+		raise ValueError('Only equality, presence and substring filters are supported: %s' % s)
+	attr = attr.lower()
+	if '*' in value:
+		if value == '*':
+			regex = None
+		else:
+			regex = re.compile('.*'.join([re.escape(_unescape(x).lower()) for x in value.split('*')]) + '$', re.DOTALL)
+		return (('*', attr, regex), end + 1)
+	return (('=', attr, _unescape(value).lower()), end + 1)
+
+def _candidates(node):
+	# DNs possibly matching node according to the indexes, None if unknown
+	op = node[0]
+	if op == '=' and node[1] in fake_ldap_indexes:
+		return fake_ldap_indexes[node[1]].get(node[2], frozenset())
+	if op == '&':
+		sets = [x for x in [_candidates(y) for y in node[1]] if x is not None]
+		if len(sets) == 0:
+			return None
+		sets.sort(key = len)
+		return sets[0].intersection(*sets[1:])
+	if op == '|':
+		sets = [_candidates(y) for y in node[1]]
+		if None in sets:
+			return None
+		return set().union(*sets)
+	return None
+
+def _matches(node, entry):
+	op = node[0]
+	if op == '&':
+		return all([_matches(x, entry) for x in node[1]])
+	if op == '|':
+		return any([_matches(x, entry) for x in node[1]])
+	if op == '!':
+		return not _matches(node[1], entry)
+	values = entry.get(node[1])
+	if op == '=':
+		return node[2] in [x.lower() for x in values]
+	if node[2] is None:
+		return len(values) > 0
+	return any([node[2].match(x.lower()) for x in values])
+
+def _find(search_filter, attrs):
+	# like the real directory only posix accounts are searched
+	tree = ('&', [('=', 'objectclass', 'posixaccount'), parse_filter(search_filter)])
+	dns = _candidates(tree)
+	if dns is None:
+		dns = fake_ldap_users.keys()
 	ret = []
-	for (k, v) in fake_ldap_users.iteritems():
-		if attribute in v and value in v[attribute]:
-			ret.append(dict([(x, v[x]) for x in attrs]))
+	for dn in dns:
+		entry = fake_ldap_users[dn]
+		if _matches(tree, entry):
+			if attrs is None:
+				found = entry.attrs
+			else:
+				found = dict([(x, entry.get(x.lower())) for x in attrs if len(entry.get(x.lower())) > 0])
+			ret.append((dn, dict([(x, list(y)) for (x, y) in found.iteritems()])))
 	return ret
 
+class DelayedResult(LDAPResult):
+
+	"""LDAPResult not ready before the configured latency is over"""
+
+	def __init__(self, value, due):
+		LDAPResult.__init__(self, value)
+		self.due = due
+
+	def ready(self):
+		return time() >= self.due
+
+	def result(self, timeout = -1):
+		wait = self.due - time()
+		if timeout >= 0 and wait > timeout:
+			sleep(timeout)
+			raise ldap.TIMEOUT('LDAP search did not complete in %s seconds' % str(timeout))
+		if wait > 0:
+			sleep(wait)
+		return LDAPResult.result(self, timeout)
+
+def search_accounts(search_filter, attrs):
+	# returns (dn, attrs) tuples like python-ldap does
+	if latency > 0:
+		sleep(latency)
+	return _find(search_filter, attrs)
+
+def search_accounts_async(search_filter, attrs):
+	if latency > 0:
+		return DelayedResult(_find(search_filter, attrs), time() + latency)
+	return LDAPResult(_find(search_filter, attrs))
+
 def get_attrs_from_uid(uid, attrs):
-	res = get_account_attrs('uid=%s' % uid, attrs)
+	res = get_account_attrs(filter_format('uid=%s', [uid]), attrs)
 	if res is None or len(res) == 0:
 		return None
 	if len(res) > 1:
@@ -95,8 +339,8 @@ def get_email_from_uid(uid):
 def get_uid_from_email(email):
 	# more than one can be returned in principle
 	uids = []
-	for a in get_account_attrs('mail=%s' % email, ['uid']):
-		uids += a['uids']
+	for a in get_account_attrs(filter_format('mail=%s', [email]), ['uid']):
+		uids += a['uid']
 	return uids
 
 def change_ldap_password(uid, new_password):
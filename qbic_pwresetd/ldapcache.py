@@ -0,0 +1,147 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Event, Lock
+from time import time
+
+class _Flight(object):
+
+	"""A lookup in progress, shared by all the callers asking for the same key"""
+
+	def __init__(self):
+		self.done = Event()
+		self.value = None
+		self.error = None
+
+class TTLCache(object):
+
+	"""
+	Bounded LRU cache with a time to live for each entry. Empty results
+	(user not found) are kept for negative_ttl seconds only.
+	Concurrent get() calls for the same missing key run the loader once
+	and share its result.
+	"""
+
+	def __init__(self, size, ttl, negative_ttl):
+		self.size = size
+		self.ttl = ttl
+		self.negative_ttl = negative_ttl
+		self._entries = OrderedDict()
+		self._flights = {}
+		self._lock = Lock()
+		self.hits = 0
+		self.misses = 0
+		self.coalesced = 0
+
+	def __len__(self):
+		return len(self._entries)
+
+	def get(self, key, loader):
+		with self._lock:
+			entry = self._entries.pop(key, None)
+			if entry is not None and entry[0] > time():
+				# put it back as most recently used
+				self._entries[key] = entry
+				self.hits += 1
+				return deepcopy(entry[1])
+			flight = self._flights.get(key)
+			leader = flight is None
+			if leader:
+				flight = _Flight()
+				self._flights[key] = flight
+				self.misses += 1
+			else:
+				self.coalesced += 1
+		if not leader:
+			flight.done.wait()
+			if flight.error is not None:
+				raise flight.error
+			return deepcopy(flight.value)
+		try:
+			flight.value = loader()
+		except Exception as e:
+			flight.error = e
+			raise
+		finally:
+			with self._lock:
+				del self._flights[key]
+				if flight.error is None:
+					self._store(key, flight.value)
+			flight.done.set()
+		return deepcopy(flight.value)
+
+	def peek(self, key):
+		"""
+		Non blocking lookup for callers doing the LDAP query themselves.
+		Returns (True, value) on a hit, (False, None) otherwise. On a miss
+		the caller should put() the result once it has it.
+		"""
+		with self._lock:
+			entry = self._entries.pop(key, None)
+			if entry is not None and entry[0] > time():
+				self._entries[key] = entry
+				self.hits += 1
+				return (True, deepcopy(entry[1]))
+			self.misses += 1
+		return (False, None)
+
+	def put(self, key, value):
+		with self._lock:
+			self._store(key, value)
+		return
+
+	def _store(self, key, value):
+		ttl = self.ttl if value else self.negative_ttl
+		if ttl <= 0:
+			return
+		self._entries[key] = (time() + ttl, deepcopy(value))
+		while len(self._entries) > self.size:
+			self._entries.popitem(last = False)
+		return
+
+	def invalidate(self, match):
+		"""drop all the entries whose key satisfies match(key)"""
+		with self._lock:
+			for key in [x for x in self._entries if match(x)]:
+				del self._entries[key]
+		return
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+		return
+
+	def stats(self):
+		with self._lock:
+			lookups = self.hits + self.misses + self.coalesced
+			return {
+				'entries': len(self._entries),
+				'hits': self.hits,
+				'misses': self.misses,
+				'coalesced': self.coalesced,
+				# every hit and every coalesced lookup is an LDAP query we didn't run
+				'queries_saved': self.hits + self.coalesced,
+				'hit_rate': float(self.hits + self.coalesced) / lookups if lookups > 0 else 0.0,
+			}
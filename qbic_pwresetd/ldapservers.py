@@ -0,0 +1,103 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+from time import time
+
+class LDAPServer(object):
+
+	"""One directory server with its moving latency estimate and health"""
+
+	def __init__(self, uri, primary = False):
+		self.uri = uri
+		self.primary = primary
+		# exponentially weighted moving average, in seconds. None until measured
+		self.latency = None
+		self.failures = 0
+		self.ejected_until = 0
+
+	def available(self, now):
+		# once the ejection time is over the server gets probed by the next
+		# connection attempt and reinstated if that works
+		return self.ejected_until <= now
+
+	def __str__(self):
+		return '%s%s latency %s failures %d%s' % (
+			self.uri,
+			' (primary)' if self.primary else '',
+			'%.1fms' % (self.latency * 1000) if self.latency is not None else 'unknown',
+			self.failures,
+			' ejected for %ds' % (self.ejected_until - time()) if not self.available(time()) else '',
+		)
+
+class ServerPool(object):
+
+	"""
+	The first URI is the primary and takes all the writes, reads go to the
+	fastest server not ejected. A server is ejected after max_failures
+	consecutive errors, for eject_time seconds doubling at each further
+	failure up to max_eject_time.
+	"""
+
+	def __init__(self, uris, alpha = 0.3, max_failures = 1, eject_time = 30, max_eject_time = 600):
+		if len(uris) == 0:
+			raise ValueError('at least one LDAP URI is needed')
+		self.servers = [LDAPServer(uri, i == 0) for (i, uri) in enumerate(uris)]
+		self.alpha = alpha
+		self.max_failures = max_failures
+		self.eject_time = eject_time
+		self.max_eject_time = max_eject_time
+
+	def primary(self):
+		return self.servers[0]
+
+	def readers(self):
+		"""servers to try for reading, best first. Never empty"""
+		now = time()
+		candidates = [x for x in self.servers if x.available(now)]
+		if len(candidates) == 0:
+			# everything is down, better try anyway than fail right away.
+			# The one coming back first is the most likely to work
+			return sorted(self.servers, key = lambda x: x.ejected_until)
+		# unmeasured servers first, so they get a latency estimate
+		return sorted(candidates, key = lambda x: x.latency if x.latency is not None else -1)
+
+	def record_success(self, server, elapsed):
+		if server.latency is None:
+			server.latency = elapsed
+		else:
+			server.latency = self.alpha * elapsed + (1 - self.alpha) * server.latency
+		server.failures = 0
+		server.ejected_until = 0
+		return
+
+	def record_failure(self, server):
+		"""returns True if the server got ejected"""
+		server.failures += 1
+		if server.failures < self.max_failures:
+			return False
+		backoff = min(self.eject_time * 2 ** (server.failures - self.max_failures), self.max_eject_time)
+		server.ejected_until = time() + backoff
+		return True
+
+	def __str__(self):
+		return ', '.join([str(x) for x in self.servers])
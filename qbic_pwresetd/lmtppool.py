@@ -0,0 +1,184 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+import smtplib
+import socket
+
+from Queue import Queue, Empty
+from threading import Lock, Thread
+from time import time
+
+from .metrics import backend_call
+
+class BatchResult(object):
+
+	def __init__(self):
+		self.sent = []
+		self.failed = []
+		self.retries = 0
+		self.connects = 0
+		self.elapsed = 0.0
+
+	def rate(self):
+		"""messages delivered per second"""
+		return len(self.sent) / self.elapsed if self.elapsed > 0 else 0.0
+
+	def __str__(self):
+		return '%d sent, %d failed, %d retries, %d connects in %.2fs (%.1f msg/s)' % (
+			len(self.sent), len(self.failed), self.retries, self.connects, self.elapsed, self.rate()
+		)
+
+def _permanent(e):
+	# 5xx answers won't get better trying again, anything else might
+	if isinstance(e, smtplib.SMTPRecipientsRefused):
+		return all([x[0] >= 500 for x in e.recipients.itervalues()])
+	if isinstance(e, smtplib.SMTPResponseException):
+		return e.smtp_code >= 500
+	return False
+
+class _Slot(object):
+
+	"""One connection of the pool, used by a single thread at a time"""
+
+	def __init__(self):
+		self.conn = None
+		self.last_used = 0
+
+class LMTPPool(object):
+
+	"""
+	Up to size LMTP connections kept open between batches. send() delivers
+	a batch over them in parallel. A message failing with a temporary error
+	or because the connection dropped is retried, on a new connection if
+	needed, up to retries times. The other messages are not affected.
+	warn, if not None, is called with a message for each failed attempt
+	"""
+
+	def __init__(self, host = 'localhost', size = 2, retries = 2, max_idle = 60, warn = None):
+		self.host = host
+		self._warn = warn
+		self.size = size
+		self.retries = retries
+		# close connections unused for longer, the server might have dropped them
+		self.max_idle = max_idle
+		self._slots = [_Slot() for i in xrange(size)]
+		self._lock = Lock()
+		# one batch at a time, each slot belongs to one thread of the batch
+		self._batch_lock = Lock()
+		self.stats = {'sent': 0, 'failed': 0, 'retries': 0, 'connects': 0}
+
+	def _connect(self, slot, res):
+		self._close(slot)
+		conn = smtplib.LMTP()
+		with backend_call('lmtp', 'connect'):
+			conn.connect(self.host)
+		slot.conn = conn
+		slot.last_used = time()
+		with self._lock:
+			res.connects += 1
+		return
+
+	def _close(self, slot):
+		if slot.conn is not None:
+			try:
+				slot.conn.quit()
+			except (smtplib.SMTPException, socket.error):
+				slot.conn.close()
+			slot.conn = None
+		return
+
+	def _deliver(self, slot, msg, res):
+		(key, from_addr, to_addrs, body) = msg
+		for attempt in xrange(self.retries + 1):
+			if attempt > 0:
+				with self._lock:
+					res.retries += 1
+			try:
+				if slot.conn is None or time() - slot.last_used > self.max_idle:
+					self._connect(slot, res)
+				with backend_call('lmtp', 'sendmail'):
+					slot.conn.sendmail(from_addr, to_addrs, body)
+				slot.last_used = time()
+				return True
+			except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, socket.error) as e:
+				if self._warn is not None:
+					self._warn('LMTP connection error delivering %s: %s' % (key, str(e)))
+				# reconnect at the next attempt
+				if slot.conn is not None:
+					slot.conn.close()
+					slot.conn = None
+			except smtplib.SMTPException as e:
+				if self._warn is not None:
+					self._warn('LMTP server error delivering %s: %s' % (key, str(e)))
+				if _permanent(e):
+					break
+				try:
+					slot.conn.rset()
+				except (smtplib.SMTPException, socket.error):
+					self._close(slot)
+		return False
+
+	def _worker(self, slot, jobs, res):
+		while True:
+			try:
+				msg = jobs.get_nowait()
+			except Empty:
+				return
+			ok = self._deliver(slot, msg, res)
+			with self._lock:
+				(res.sent if ok else res.failed).append(msg[0])
+		return
+
+	def send(self, messages):
+		"""
+		messages are (key, from_addr, to_addrs, body) tuples. Returns a
+		BatchResult with the keys of the messages delivered and not
+		"""
+		res = BatchResult()
+		start = time()
+		jobs = Queue()
+		for m in messages:
+			jobs.put(m)
+		slots = self._slots[:min(self.size, len(messages))]
+		with self._batch_lock:
+			if len(slots) == 1:
+				# no need for a thread
+				self._worker(slots[0], jobs, res)
+			else:
+				threads = [Thread(target = self._worker, args = (x, jobs, res)) for x in slots]
+				for t in threads:
+					t.start()
+				for t in threads:
+					t.join()
+		res.elapsed = time() - start
+		with self._lock:
+			self.stats['sent'] += len(res.sent)
+			self.stats['failed'] += len(res.failed)
+			self.stats['retries'] += res.retries
+			self.stats['connects'] += res.connects
+		return res
+
+	def close(self):
+		for slot in self._slots:
+			self._close(slot)
+		return
@@ -0,0 +1,141 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# Emails rendered straight to the string MIMEText(...).as_string() would
+# give, without building the message object for every email. Everything
+# not depending on the recipient is prepared once when the config is loaded
+
+import re
+
+from email.header import Header
+from email.mime.text import MIMEText
+from pytz import utc
+from string import Template
+
+# see email.generator.Generator
+max_header_len = 78
+_from_re = re.compile(r'^From ', re.MULTILINE)
+
+def _is8bitstring(s):
+	if isinstance(s, str):
+		try:
+			unicode(s, 'us-ascii')
+		except UnicodeError:
+			return True
+	return False
+
+def header_line(name, value):
+	"""a header line as the email Generator writes it"""
+	if _is8bitstring(value):
+		return '%s: %s\n' % (name, value)
+	if len(name) + 2 + len(value) <= max_header_len and value == value.strip() and '\n' not in value:
+		# nothing to fold or strip
+		return '%s: %s\n' % (name, value)
+	return '%s: %s\n' % (name, Header(value, maxlinelen = max_header_len, header_name = name).encode())
+
+def _envelope(encoding):
+	return ('Content-Type: text/plain; charset="us-ascii"\n' +
+			'MIME-Version: 1.0\n' +
+			'Content-Transfer-Encoding: %s\n' % encoding)
+
+class MessageTemplate(object):
+
+	"""
+	A plain text email. The body is a string.Template with the same
+	placeholders as before, turned into a % format string once.
+	render() gives the same output as MIMEText with From, Subject and To set
+	"""
+
+	def __init__(self, template, from_addr, subject):
+		if not isinstance(template, Template):
+			template = Template(template)
+		self.template = template
+		self.from_addr = from_addr
+		self.subject = subject
+		self._format = self._compile(template)
+		fixed_headers = header_line('From', from_addr) + header_line('Subject', subject)
+		self._head_7bit = _envelope('7bit') + fixed_headers
+		self._head_8bit = _envelope('8bit') + fixed_headers
+
+	@staticmethod
+	def _compile(template):
+		parts = []
+		pos = 0
+		for m in template.pattern.finditer(template.template):
+			parts.append(template.template[pos:m.start()].replace('%', '%%'))
+			pos = m.end()
+			if m.group('escaped') is not None:
+				parts.append(template.delimiter.replace('%', '%%'))
+			elif m.group('invalid') is not None:
+				raise ValueError('Invalid placeholder in template at position %d' % m.start('invalid'))
+			else:
+				parts.append('%%(%s)s' % (m.group('named') or m.group('braced')))
+		parts.append(template.template[pos:].replace('%', '%%'))
+		return ''.join(parts)
+
+	def body(self, **values):
+		body = self._format % values
+		if 'From ' in body:
+			body = _from_re.sub('>From ', body)
+		return body
+
+	def render(self, to, **values):
+		if isinstance(to, unicode) or [x for x in values.itervalues() if isinstance(x, unicode)]:
+			# MIMEText does its own thing with unicode, let it
+			return self.render_mime(to, **values)
+		body = self.body(**values)
+		head = self._head_8bit if _is8bitstring(body) else self._head_7bit
+		return head + header_line('To', to) + '\n' + body
+
+	def render_mime(self, to, **values):
+		"""the slow way, render() must always give the same result"""
+		msg = MIMEText(self.template.substitute(**values))
+		msg['From'] = self.from_addr
+		msg['Subject'] = self.subject
+		msg['To'] = to
+		return msg.as_string()
+
+class ExpiryDateFormatter(object):
+
+	"""
+	strftime of UTC datetimes in the local timezone. The pytz conversion is
+	done once for every quarter of an hour, offsets don't change more often
+	"""
+
+	def __init__(self, tz, date_format, cache_size = 1024):
+		self.tz = tz
+		self.date_format = date_format
+		self.cache_size = cache_size
+		self._tzinfos = {}
+
+	def format(self, utc_date):
+		key = utc_date.replace(minute = utc_date.minute - utc_date.minute % 15, second = 0, microsecond = 0)
+		conv = self._tzinfos.get(key)
+		if conv is None:
+			if len(self._tzinfos) >= self.cache_size:
+				self._tzinfos.clear()
+			local = key.replace(tzinfo = utc).astimezone(self.tz)
+			conv = (local.utcoffset(), local.tzinfo)
+			self._tzinfos[key] = conv
+		(offset, tzinfo) = conv
+		return (utc_date + offset).replace(tzinfo = tzinfo).strftime(self.date_format)
@@ -0,0 +1,208 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# In process counters and latency histograms, exported in the Prometheus
+# text format by the STATS command and optionally to a file for the node
+# exporter textfile collector
+
+import os
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Event, Lock, Thread
+from time import time
+
+from .tracing import span
+
+# seconds
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+metric_help = {
+	'pwresetd_connections_total': ('counter', 'Client connections by result'),
+	'pwresetd_commands_total': ('counter', 'Commands handled by command and answer status'),
+	'pwresetd_command_duration_seconds': ('histogram', 'Time to handle a command, answer included'),
+	'pwresetd_backend_duration_seconds': ('histogram', 'Time spent in database, LDAP and LMTP calls'),
+	'pwresetd_backend_errors_total': ('counter', 'Database, LDAP and LMTP calls ending with an exception'),
+	'pwresetd_emails_total': ('counter', 'Emails by delivery result'),
+	'pwresetd_lmtp_retries_total': ('counter', 'Messages sent again after a temporary LMTP failure'),
+	'pwresetd_log_dropped_total': ('counter', 'Log messages dropped because the log queue was full'),
+	'pwresetd_shed_total': ('counter', 'Connections answered BUSY without being served, by reason'),
+	'pwresetd_ratelimited_total': ('counter', 'Commands refused for exceeding a rate limit, by command and limit'),
+	'pwresetd_secrets_rejected_total': ('counter', 'Secrets refused without a database query, by reason'),
+	'pwresetd_loop_busy_seconds': ('histogram', 'Time the main loop was kept busy before waiting for connections again'),
+	'pwresetd_loop_stalls_total': ('counter', 'Times the main loop was busy longer than stall_threshold'),
+	'pwresetd_admission_wait_seconds': ('histogram', 'Time connections waited in the admission queue'),
+}
+
+class Histogram(object):
+
+	def __init__(self, buckets = default_buckets):
+		self.buckets = buckets
+		# last one is +Inf
+		self.counts = [0] * (len(buckets) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value):
+		self.counts[bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+		return
+
+def _escape(value):
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels, extra = None):
+	pairs = list(labels)
+	if extra is not None:
+		pairs.append(extra)
+	if len(pairs) == 0:
+		return ''
+	return '{%s}' % ','.join(['%s="%s"' % (k, _escape(v)) for (k, v) in pairs])
+
+def _number(value):
+	if isinstance(value, float):
+		return repr(value)
+	return str(value)
+
+class Registry(object):
+
+	"""Thread safe set of counters and histograms, identified by name and labels"""
+
+	def __init__(self):
+		self._lock = Lock()
+		self._counters = {}
+		self._histograms = {}
+
+	def inc(self, name, value = 1, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self._lock:
+			self._counters[key] = self._counters.get(key, 0) + value
+		return
+
+	def observe(self, name, value, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self._lock:
+			h = self._histograms.get(key)
+			if h is None:
+				h = self._histograms[key] = Histogram()
+			h.observe(value)
+		return
+
+	def counter(self, name, **labels):
+		with self._lock:
+			return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+	def histogram(self, name, **labels):
+		with self._lock:
+			return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+	def clear(self):
+		with self._lock:
+			self._counters.clear()
+			self._histograms.clear()
+		return
+
+	def prometheus_text(self):
+		with self._lock:
+			counters = sorted(self._counters.items())
+			histograms = sorted([(k, (list(h.counts), h.sum, h.count, h.buckets)) for (k, h) in self._histograms.iteritems()])
+		lines = []
+		described = set()
+		def describe(name, kind):
+			if name not in described:
+				described.add(name)
+				lines.append('# HELP %s %s' % (name, metric_help.get(name, (kind, name))[1]))
+				lines.append('# TYPE %s %s' % (name, kind))
+		for ((name, labels), value) in counters:
+			describe(name, 'counter')
+			lines.append('%s%s %s' % (name, _labels(labels), _number(value)))
+		for ((name, labels), (counts, total, count, buckets)) in histograms:
+			describe(name, 'histogram')
+			cumulative = 0
+			for (le, n) in zip(buckets, counts):
+				cumulative += n
+				lines.append('%s_bucket%s %d' % (name, _labels(labels, ('le', repr(le))), cumulative))
+			lines.append('%s_bucket%s %d' % (name, _labels(labels, ('le', '+Inf')), count))
+			lines.append('%s_sum%s %s' % (name, _labels(labels), repr(total)))
+			lines.append('%s_count%s %d' % (name, _labels(labels), count))
+		return '\n'.join(lines) + '\n'
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+@contextmanager
+def backend_call(backend, op):
+	"""
+	time a call to the database, LDAP or LMTP server and count its failures,
+	also as a phase of the request being traced
+	"""
+	start = time()
+	try:
+		with span(backend, op):
+			yield
+	except:
+		registry.inc('pwresetd_backend_errors_total', backend = backend, op = op)
+		raise
+	finally:
+		registry.observe('pwresetd_backend_duration_seconds', time() - start, backend = backend, op = op)
+
+def write_textfile(path, reg = registry):
+	# write and rename, the collector must never read a partial file
+	tmp = '%s.%d.tmp' % (path, os.getpid())
+	with open(tmp, 'w') as f:
+		f.write(reg.prometheus_text())
+	os.rename(tmp, path)
+	return
+
+class TextfileWriter(Thread):
+
+	"""
+	Rewrites the metrics file every interval seconds until stop(). warn, if
+	not None, is called with a message when writing fails
+	"""
+
+	def __init__(self, path, interval, reg = registry, warn = None):
+		Thread.__init__(self, name = 'metrics-textfile')
+		self.daemon = True
+		self.path = path
+		self.interval = interval
+		self.registry = reg
+		self._warn = warn
+		self._stop_event = Event()
+
+	def run(self):
+		while True:
+			try:
+				write_textfile(self.path, self.registry)
+			except (IOError, OSError) as e:
+				if self._warn is not None:
+					self._warn('Failed to write metrics to %s: %s' % (self.path, str(e)))
+			if self._stop_event.wait(self.interval) or self._stop_event.is_set():
+				return
+
+	def stop(self):
+		self._stop_event.set()
+		self.join()
+		return
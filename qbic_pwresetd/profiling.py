@@ -0,0 +1,115 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# cProfile collection started and stopped while the daemon runs, so hot
+# spots can be found without restarting it. Only the thread calling start()
+# is profiled, which for the daemon is the one handling the requests
+
+import cProfile
+import os
+
+from time import strftime, time
+
+try:
+	import tracemalloc
+except ImportError:
+	# python 2 needs the pytracemalloc patches
+	tracemalloc = None
+
+class Profiler(object):
+
+	def __init__(self, directory, prefix = 'pwresetd'):
+		self.directory = directory
+		self.prefix = prefix
+		self._profile = None
+		self._memory = False
+		self._snapshot = None
+		self.deadline = None
+		self.requests_left = None
+
+	def running(self):
+		return self._profile is not None
+
+	def start(self, seconds = None, requests = None, memory = False):
+		"""
+		Collect until stop() is called, seconds have passed or requests
+		requests are done, whatever comes first. The deadline is only
+		checked by request_done() and expired(): the caller has to make sure
+		one of them is called when the daemon is idle (e.g. with an alarm)
+		"""
+		if self.running():
+			raise RuntimeError('profiling already running')
+		if memory and tracemalloc is None:
+			raise RuntimeError('tracemalloc is not available')
+		self.deadline = time() + seconds if seconds else None
+		self.requests_left = requests or None
+		self._memory = memory
+		if memory:
+			if not tracemalloc.is_tracing():
+				tracemalloc.start()
+			self._snapshot = tracemalloc.take_snapshot()
+		self._profile = cProfile.Profile()
+		self._profile.enable()
+		return
+
+	def expired(self):
+		return self.running() and self.deadline is not None and time() >= self.deadline
+
+	def request_done(self):
+		"""returns the files written if this request ended the collection"""
+		if not self.running():
+			return None
+		if self.requests_left is not None:
+			self.requests_left -= 1
+			if self.requests_left <= 0:
+				return self.stop()
+		if self.expired():
+			return self.stop()
+		return None
+
+	def stop(self, top = 40):
+		"""
+		Stop collecting and write the stats, the same sorted by cumulative
+		time as text and, with memory, the allocations grown meanwhile.
+		Returns the paths of the files written
+		"""
+		if not self.running():
+			return []
+		self._profile.disable()
+		profile = self._profile
+		self._profile = None
+		base = os.path.join(self.directory, '%s-%s-%d' % (self.prefix, strftime('%Y%m%d-%H%M%S'), os.getpid()))
+		paths = [base + '.prof', base + '.txt']
+		profile.dump_stats(paths[0])
+		import pstats
+		with open(paths[1], 'w') as f:
+			pstats.Stats(profile, stream = f).sort_stats('cumulative').print_stats(top)
+		if self._memory:
+			snapshot = tracemalloc.take_snapshot()
+			tracemalloc.stop()
+			paths.append(base + '.memory.txt')
+			with open(paths[2], 'w') as f:
+				for stat in snapshot.compare_to(self._snapshot, 'lineno')[:top]:
+					f.write('%s\n' % str(stat))
+			self._snapshot = None
+		return paths
@@ -21,15 +21,102 @@
 
 __author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
 
-import pwquality
-
+from contextlib import contextmanager
+from .breached import BreachedIndex
 from math import exp, log
+from Queue import Queue, Empty
+from string import maketrans
+from threading import Lock
+
+# imported with the first PWQContext, it's not needed to start the daemon
+pwquality = None
+
+def _load_pwquality():
+	global pwquality
+	if pwquality is None:
+		pwquality = __import__('pwquality')
+	return pwquality
+
+class PWQContext(object):
+
+	"""PWQSettings with our options applied, used by one thread at a time"""
+
+	def __init__(self):
+		self.settings = _load_pwquality().PWQSettings()
+		self.settings.read_config()
+		self.settings.set_option('gecoscheck=0')
+		self.settings.set_option('maxrepeat=3')
+		self.badwords = None
+		self.set_badwords('')
+
+	def set_badwords(self, badwords):
+		# pwquality parses the option again at every set, skip it when the
+		# same user is checked again
+		if badwords != self.badwords:
+			self.settings.set_option('badwords=%s' % badwords)
+			self.badwords = badwords
+		return
+
+	def check(self, passwd):
+		return self.settings.check(passwd)
 
-pwq = pwquality.PWQSettings()
-pwq.read_config()
-pwq.set_option('badwords=')
-pwq.set_option('gecoscheck=0')
-pwq.set_option('maxrepeat=3')
+class PWQPool(object):
+
+	"""
+	Up to size PWQContext, created when first needed. lease() hands one out
+	for exclusive use, waiting if all of them are busy
+	"""
+
+	def __init__(self, size):
+		if size <= 0:
+			raise ValueError('pool size must be a positive integer, got %s' % repr(size))
+		self.size = size
+		self.created = 0
+		self._idle = Queue()
+		self._lock = Lock()
+
+	def _get(self):
+		try:
+			return self._idle.get_nowait()
+		except Empty:
+			pass
+		with self._lock:
+			create = self.created < self.size
+			if create:
+				self.created += 1
+		if create:
+			try:
+				return PWQContext()
+			except:
+				with self._lock:
+					self.created -= 1
+				raise
+		return self._idle.get()
+
+	@contextmanager
+	def lease(self):
+		ctx = self._get()
+		try:
+			yield ctx
+		finally:
+			self._idle.put(ctx)
+
+pwq_pool = PWQPool(4)
+breached_index = None
+
+def init_pwq_pool(size):
+	global pwq_pool
+	pwq_pool = PWQPool(size)
+	return
+
+def init_breached_index(path):
+	"""reject the passwords found in the index at path, None disables the check"""
+	global breached_index
+	old = breached_index
+	breached_index = BreachedIndex(path) if path is not None else None
+	if old is not None:
+		old.close()
+	return
 
 leet_dict = {
 	'1': 'i',
@@ -45,23 +132,26 @@ leet_dict = {
 	'@': 'a',
 	'$': 's',
 }
+# translation tables for str.translate and unicode.translate
+leet_table = maketrans(''.join(leet_dict.keys()), ''.join(leet_dict.values()))
+leet_unicode_table = dict([(ord(k), unicode(v)) for (k, v) in leet_dict.iteritems()])
+
 def remove_leet(word):
-	for l in leet_dict.iterkeys():
-		word = word.replace(l, leet_dict[l])
-	return word
+	if isinstance(word, unicode):
+		return word.translate(leet_unicode_table)
+	return word.translate(leet_table)
 
 def longest_common_substring(s1, s2):
-	m = [[0] * (1 + len(s2)) for i in xrange(1 + len(s1))]
+	# slide over s1 trying to grow the longest match found so far by one
+	# character ending at the current position. A common substring of length
+	# n + 1 contains one of length n, so this finds the longest one, the first
+	# in s1 if there are many, with len(s1) + longest substring searches
+	# done by the interpreter in C
 	longest, x_longest = 0, 0
 	for x in xrange(1, 1 + len(s1)):
-		for y in xrange(1, 1 + len(s2)):
-			if s1[x - 1] == s2[y - 1]:
-				m[x][y] = m[x - 1][y - 1] + 1
-				if m[x][y] > longest:
-					longest = m[x][y]
-					x_longest = x
-			else:
-				m[x][y] = 0
+		while longest < x and s1[x - longest - 1:x] in s2:
+			longest += 1
+			x_longest = x
 	return s1[x_longest - longest: x_longest]
 
 def similar(passwd, word):
@@ -70,25 +160,30 @@ def similar(passwd, word):
 		return 0
 	return lcsl - 1
 
-def pwq_score(passwd):
+def pwq_score(ctx, passwd):
 	try:
-		ret = pwq.check(passwd)
+		ret = ctx.check(passwd)
 	except pwquality.PWQError as e:
 		return (-1, e)
 	return (ret, None)
 
 def pwd_score(passwd, badwords):
+	# hashes are of the password as typed, check it before changing case
+	if breached_index is not None and passwd in breached_index:
+		return (-1, 'The password is in a list of breached passwords')
 	# convert everything to lower case
 	passwd = passwd.lower()
 	badwords = [x.lower() for x in badwords]
+	passwd_noleet = remove_leet(passwd)
 	my_score = len(passwd)
 
 	for w in badwords:
-		my_score -= max(similar(passwd, w), similar(remove_leet(passwd), w))
+		my_score -= max(similar(passwd, w), similar(passwd_noleet, w))
 	
-	pwq.set_option('badwords=%s' % ' '.join(badwords))
-	(q_score, pwq_error) = pwq_score(passwd)
-	(q_score_leet, pwq_error_leet) = pwq_score(remove_leet(passwd))
+	with pwq_pool.lease() as ctx:
+		ctx.set_badwords(' '.join(badwords))
+		(q_score, pwq_error) = pwq_score(ctx, passwd)
+		(q_score_leet, pwq_error_leet) = pwq_score(ctx, passwd_noleet)
 	if q_score_leet < q_score:
 		q_score = q_score_leet
 		pwq_error = pwq_error_leet
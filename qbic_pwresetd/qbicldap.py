@@ -23,8 +23,13 @@ __author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
 
 import ldap
 
-from passlib.apps import ldap_context
+from ldap.filter import filter_format
+from time import time
 from . import config, ArgumentError
+from .ldapcache import TTLCache
+from .ldapservers import ServerPool
+from .metrics import backend_call
+from .tracing import span
 
 ldap_crypto_context = "ldap_sha512_crypt"
 reader_ldap = None
@@ -38,20 +43,43 @@ reader_bind_dn = None
 reader_bind_pwd = None
 qbic_ldap_base = None
 qbic_user_base = None
+account_cache = None
+# DN of the accounts seen by the reader, spares the pwadmin a search
+# before changing the password
+dn_cache = TTLCache(4096, 3600, 0)
+ldap_servers = None
+reader_server = None
+network_timeout = None
+operation_timeout = None
 
-def init_ldap(qbic_luri, pwadmin_bdn, pwadmin_bpwd, reader_bdn, reader_bpwd, qbic_lbase, qbic_ubase):
+# errors telling the server is unusable, reads are retried on another one
+_failover_errors = (ldap.SERVER_DOWN, ldap.CONNECT_ERROR, ldap.TIMEOUT, ldap.UNAVAILABLE, ldap.BUSY)
+# errors connecting that count as a failure of the server. Others, e.g.
+# wrong bind credentials, would be the same on any server
+_connect_failure_errors = (ldap.SERVER_DOWN, ldap.CONNECT_ERROR, ldap.TIMEOUT)
+# called with a message for the daemon log, e.g. when a server is ejected
+warn = None
+
+def init_ldap(qbic_luri, pwadmin_bdn, pwadmin_bpwd, reader_bdn, reader_bpwd, qbic_lbase, qbic_ubase,
+		eject_time = 30, network_tout = None, operation_tout = None):
+	"""
+	qbic_luri can be a space separated list of URIs: the first is the primary
+	server, used for password changes, the others are read only replicas
+	"""
 	global qbic_ldap_uri, pwadmin_bind_dn, pwadmin_bind_pwd, reader_bind_dn, reader_bind_pwd, qbic_ldap_base, qbic_user_base
-	global connect_reader_ldap, connect_pwadmin_ldap, disconnect_ldap, get_account_attrs, _change_ldap_password
-	if qbic_luri == fake_ldap_uri:
+	global ldap_servers, network_timeout, operation_timeout
+	global connect_reader_ldap, connect_pwadmin_ldap, disconnect_ldap, _search_accounts, _search_accounts_async
+	global _change_ldap_password
+	if qbic_luri == fake_ldap_uri or qbic_luri.startswith(fake_ldap_uri + ':'):
 		from . import fakeqbicldap
 		# have the fake sneaking in (Enrico is a cheater :P)
 		connect_reader_ldap = fakeqbicldap.connect_reader_ldap
 		connect_pwadmin_ldap = fakeqbicldap.connect_pwadmin_ldap
 		disconnect_ldap = fakeqbicldap.disconnect_ldap
-		get_account_attrs = fakeqbicldap.get_account_attrs
+		_search_accounts = fakeqbicldap.search_accounts
+		_search_accounts_async = fakeqbicldap.search_accounts_async
 		_change_ldap_password = fakeqbicldap.change_ldap_password
-		# put some data in the DB
-		fakeqbicldap.add_fake_user(**fakeqbicldap.example_user)
+		fakeqbicldap.init_ldap(qbic_luri)
 	else:
 		qbic_ldap_uri = qbic_luri
 		pwadmin_bind_dn = pwadmin_bdn
@@ -60,62 +88,291 @@ def init_ldap(qbic_luri, pwadmin_bdn, pwadmin_bpwd, reader_bdn, reader_bpwd, qbi
 		reader_bind_pwd = reader_bpwd
 		qbic_ldap_base = qbic_lbase
 		qbic_user_base = qbic_ubase
+		ldap_servers = ServerPool(qbic_luri.split(), eject_time = eject_time)
+		network_timeout = network_tout
+		operation_timeout = operation_tout
 	return
 
+class LDAPResult(object):
+
+	"""
+	Result of an LDAP operation available right away, for example from the
+	cache. Same interface as PendingSearch
+	"""
+
+	def __init__(self, value, error = None):
+		self.value = value
+		self.error = error
+		self._converters = []
+
+	def then(self, convert):
+		self._converters.append(convert)
+		return self
+
+	def ready(self):
+		return True
+
+	def result(self, timeout = -1):
+		if self.error is not None:
+			raise self.error
+		res = self.value
+		for convert in self._converters:
+			res = convert(res)
+		return res
+
+	def abandon(self):
+		return
+
+class PendingSearch(object):
+
+	"""
+	LDAP search started with search_ext and still running on the server.
+	result() blocks until it's complete, ready() polls it without blocking
+	and fileno() can be handed to select() to wait for it together with
+	other sockets.
+	"""
+
+	def __init__(self, conn, msgid, fallback = None):
+		self.conn = conn
+		self.msgid = msgid
+		# called to get the result some other way if the server fails
+		self.fallback = fallback
+		self._converters = []
+		self._res = None
+		self._done = False
+
+	def then(self, convert):
+		"""apply convert to the search result once it's available"""
+		self._converters.append(convert)
+		return self
+
+	def fileno(self):
+		return self.conn.get_option(ldap.OPT_DESC)
+
+	def _collect(self, timeout):
+		try:
+			(rtype, rdata, rmsgid, rctrls) = self.conn.result3(self.msgid, all = 1, timeout = timeout)
+		except _failover_errors:
+			if self.fallback is None:
+				raise
+			rdata = self.fallback()
+		else:
+			if rtype is None:
+				# timeout == 0 and the result is not there yet
+				return False
+		self._res = rdata
+		for convert in self._converters:
+			self._res = convert(self._res)
+		self._done = True
+		return True
+
+	def ready(self):
+		return self._done or self._collect(0)
+
+	def result(self, timeout = -1):
+		if not self._done and not self._collect(timeout):
+			raise ldap.TIMEOUT('LDAP search did not complete in %s seconds' % str(timeout))
+		return self._res
+
+	def abandon(self):
+		if not self._done:
+			self._done = True
+			try:
+				self.conn.abandon_ext(self.msgid)
+			except ldap.LDAPError:
+				# the connection is gone anyway, nothing to abandon
+				pass
+		return
+
+def init_ldap_cache(size, ttl, negative_ttl):
+	global account_cache
+	if size <= 0:
+		account_cache = None
+	else:
+		account_cache = TTLCache(size, ttl, negative_ttl)
+	return
+
+def ldap_cache_stats():
+	if account_cache is None:
+		return None
+	return account_cache.stats()
+
+def ldap_servers_status():
+	if ldap_servers is None:
+		return None
+	return str(ldap_servers)
+
 def _connect_to_qldap(uri, bind_as_user, password = None):
 	qldap = ldap.initialize(uri,  trace_level=0)
 	qldap.version = ldap.VERSION3
+	if network_timeout is not None:
+		qldap.set_option(ldap.OPT_NETWORK_TIMEOUT, network_timeout)
+	if operation_timeout is not None:
+		qldap.set_option(ldap.OPT_TIMEOUT, operation_timeout)
 	#qldap.set_option(ldap.OPT_X_TLS_CACERTFILE, '/etc/pki/tls/certs/ca-bundle.crt')
 	qldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_DEMAND)
 	qldap.start_tls_s()
 	qldap.simple_bind_s(bind_as_user, password)
 	return qldap
 
-def connect_reader_ldap():
-	global reader_ldap
-	if reader_ldap is None:
-		reader_ldap = _connect_to_qldap(qbic_ldap_uri, reader_bind_dn, reader_bind_pwd)
+def _server_failed(server):
+	if ldap_servers.record_failure(server) and warn is not None:
+		warn('LDAP server %s ejected after %d consecutive failure(s)' % (server.uri, server.failures))
 	return
 
+def _timed_connect(server, bind_as_user, password):
+	start = time()
+	try:
+		with backend_call('ldap', 'connect'):
+			qldap = _connect_to_qldap(server.uri, bind_as_user, password)
+	except _connect_failure_errors:
+		_server_failed(server)
+		raise
+	ldap_servers.record_success(server, time() - start)
+	return qldap
+
+def connect_reader_ldap():
+	global reader_ldap, reader_server
+	if reader_ldap is not None:
+		return
+	error = None
+	for server in ldap_servers.readers():
+		try:
+			reader_ldap = _timed_connect(server, reader_bind_dn, reader_bind_pwd)
+			reader_server = server
+			return
+		except _failover_errors as e:
+			error = e
+	raise error
+
 def connect_pwadmin_ldap():
 	global pwadmin_ldap
 	if pwadmin_ldap is None:
-		pwadmin_ldap = _connect_to_qldap(qbic_ldap_uri, pwadmin_bind_dn, pwadmin_bind_pwd)
+		# changes go to the primary only
+		pwadmin_ldap = _timed_connect(ldap_servers.primary(), pwadmin_bind_dn, pwadmin_bind_pwd)
+	return
+
+def _reader_failed():
+	global reader_ldap, reader_server
+	_server_failed(reader_server)
+	try:
+		reader_ldap.unbind_s()
+	except ldap.LDAPError:
+		pass
+	reader_ldap = None
+	reader_server = None
+	return
+
+def warm_up():
+	"""connect and bind for reading and for password changes, load the password hashing"""
+	connect_reader_ldap()
+	connect_pwadmin_ldap()
+	_crypt_password('warm-up')
 	return
 
 def disconnect_ldap():
-	global reader_ldap
+	global reader_ldap, reader_server
 	global pwadmin_ldap
 	if reader_ldap is not None:
 		reader_ldap.unbind_s()
 		reader_ldap = None
+		reader_server = None
 	if pwadmin_ldap is not None:
 		pwadmin_ldap.unbind_s()
 		pwadmin_ldap = None
 
-def get_account_attrs(search_filter, attrs):
-	connect_reader_ldap()
+def _posix_account_filter(search_filter):
 	if search_filter.startswith('(') and search_filter.endswith(')'):
 		search_filter = search_filter[1:len(search_filter) - 1]
-	res = reader_ldap.search_ext_s(
-		qbic_ldap_base,
-		ldap.SCOPE_SUBTREE,
-		filterstr='(&(objectClass=posixAccount)(%s))' % search_filter,
-		attrlist=attrs
-	)
+	return '(&(objectClass=posixAccount)(%s))' % search_filter
+
+def _search_accounts(search_filter, attrs):
+	# returns a list of (dn, attrs) tuples
+	attempts = len(ldap_servers.servers)
+	while True:
+		connect_reader_ldap()
+		start = time()
+		try:
+			with backend_call('ldap', 'search'):
+				res = reader_ldap.search_ext_s(
+					qbic_ldap_base,
+					ldap.SCOPE_SUBTREE,
+					filterstr=_posix_account_filter(search_filter),
+					attrlist=attrs
+				)
+		except _failover_errors:
+			_reader_failed()
+			attempts -= 1
+			if attempts <= 0:
+				raise
+			continue
+		ldap_servers.record_success(reader_server, time() - start)
+		return res
+
+def _search_accounts_async(search_filter, attrs):
+	connect_reader_ldap()
+	conn = reader_ldap
+	try:
+		msgid = conn.search_ext(
+			qbic_ldap_base,
+			ldap.SCOPE_SUBTREE,
+			filterstr=_posix_account_filter(search_filter),
+			attrlist=attrs
+		)
+	except _failover_errors:
+		_reader_failed()
+		return LDAPResult(_search_accounts(search_filter, attrs))
+	def fallback():
+		if reader_ldap is conn:
+			_reader_failed()
+		return _search_accounts(search_filter, attrs)
+	return PendingSearch(conn, msgid, fallback)
+
+def get_account_attrs(search_filter, attrs):
+	res = _search_accounts(search_filter, attrs)
 	if len(res) == 0:
 		return None
 	return [args for (dn, args) in res]
 
-def get_attrs_from_uid(uid, attrs):
-	res = get_account_attrs('uid=%s' % uid, attrs)
-	if res is None or len(res) == 0:
+def _cached_accounts(search_filter, attrs):
+	if account_cache is None:
+		return _search_accounts(search_filter, attrs)
+	return account_cache.get(
+			(search_filter, tuple(sorted(attrs))),
+			lambda: _search_accounts(search_filter, attrs)
+	)
+
+def _unique_account(uid, res):
+	if len(res) == 0:
 		return None
 	if len(res) > 1:
 		# LDAP is really fscked up. Raise this so the program terminates and secure LDAP from any
 		# further interaction, it's broken anyway
 		raise RuntimeError('LDAP returned more than one element while searching for uid %s' % uid)
-	return res[0]
+	(dn, attrs) = res[0]
+	# remember it, change_ldap_password will need it
+	dn_cache.put(uid, dn)
+	return attrs
+
+def get_attrs_from_uid(uid, attrs):
+	return _unique_account(uid, _cached_accounts(filter_format('uid=%s', [uid]), attrs))
+
+def get_attrs_from_uid_async(uid, attrs):
+	"""
+	Like get_attrs_from_uid, but returns a PendingSearch (or an LDAPResult
+	if the answer is cached) so the caller can do something else meanwhile
+	"""
+	search_filter = filter_format('uid=%s', [uid])
+	if account_cache is None:
+		return _search_accounts_async(search_filter, attrs).then(lambda res: _unique_account(uid, res))
+	key = (search_filter, tuple(sorted(attrs)))
+	(found, res) = account_cache.peek(key)
+	if found:
+		return LDAPResult(res).then(lambda res: _unique_account(uid, res))
+	def cache_result(res):
+		account_cache.put(key, res)
+		return res
+	return _search_accounts_async(search_filter, attrs).then(cache_result).then(lambda res: _unique_account(uid, res))
 
 def get_email_from_uid(uid):
 	res = get_attrs_from_uid(uid, ['mail'])
@@ -127,22 +384,29 @@ def get_email_from_uid(uid):
 def get_uid_from_email(email):
 	# more than one can be returned in principle
 	uids = []
-	for a in get_account_attrs('mail=%s' % email, ['uid']):
+	for (dn, a) in _cached_accounts(filter_format('mail=%s', [email]), ['uid']):
 		uids += a['uid']
 	return uids
 	#return ['qbictest01']
 
+_password_context = None
+
 def _crypt_password(pwd):
-	lc = ldap_context.replace(default=ldap_crypto_context)
-	return lc.encrypt(pwd, rounds=5000, salt_size=16)
+	global _password_context
+	if _password_context is None:
+		# passlib is slow to import, only password changes need it
+		from passlib.apps import ldap_context
+		_password_context = ldap_context.replace(default=ldap_crypto_context)
+	with span('crypt'):
+		return _password_context.encrypt(pwd, rounds=5000, salt_size=16)
 
-def _change_ldap_password(uid, new_password):
-	connect_pwadmin_ldap()
-	res = pwadmin_ldap.search_ext_s(qbic_user_base,
-			ldap.SCOPE_SUBTREE,
-			filterstr='(&(objectClass=posixAccount)(uid=%s))' % uid,
-			attrlist=[]
-	)
+def _search_dn(uid):
+	with backend_call('ldap', 'search_dn'):
+		res = pwadmin_ldap.search_ext_s(qbic_user_base,
+				ldap.SCOPE_SUBTREE,
+				filterstr=filter_format('(&(objectClass=posixAccount)(uid=%s))', [uid]),
+				attrlist=[]
+		)
 	if len(res) == 0:
 		raise ArgumentError('No posixAccount found with uid=%s' % uid)
 	if len(res) > 1:
@@ -151,15 +415,53 @@ def _change_ldap_password(uid, new_password):
 				'Found %d entries matching uid=%s:\n%s' % \
 				(len(res), uid, '\n'.join([x[0] for x in res]))
 		)
-	dn = res[0][0]
+	return res[0][0]
+
+def _cached_dn(uid):
+	(found, dn) = dn_cache.peek(uid)
+	# the reader searches the whole qbic_ldap_base, passwords are changed
+	# only for accounts in qbic_user_base
+	if not found or not dn.lower().endswith(',' + qbic_user_base.lower()):
+		return None
+	return dn
+
+def _change_ldap_password(uid, new_password):
+	global pwadmin_ldap
+	connect_pwadmin_ldap()
+	try:
+		return _modify_ldap_password(uid, new_password)
+	except _failover_errors:
+		_server_failed(ldap_servers.primary())
+		pwadmin_ldap = None
+		raise
+
+def _modify_ldap_password(uid, new_password):
 	modlist = [(ldap.MOD_REPLACE, 'userPassword', _crypt_password(new_password))]
 #	msg = 'Calling ldap modify to change userPassword field for %s' % dn
 #	if config.testonly:
 #		msg = '[TEST] ' + msg
 #	logitout(msg, INFO)
+	# usually the DN is known from the lookup done just before by the reader
+	dn = _cached_dn(uid)
+	if dn is not None:
+		try:
+			if not config.testonly:
+				with backend_call('ldap', 'modify'):
+					pwadmin_ldap.modify_ext_s(dn, modlist)
+			return
+		except ldap.NO_SUCH_OBJECT:
+			# entry moved or renamed meanwhile, look for it
+			dn_cache.invalidate(lambda key: key == uid)
+	dn = _search_dn(uid)
 	if not config.testonly:
-		pwadmin_ldap.modify_ext_s(dn, modlist)
+		with backend_call('ldap', 'modify'):
+			pwadmin_ldap.modify_ext_s(dn, modlist)
 	return
 
 def change_ldap_password(uid, new_password):
-	return _change_ldap_password(uid, new_password)
+	try:
+		return _change_ldap_password(uid, new_password)
+	finally:
+		if account_cache is not None:
+			# whatever happened the entry may have changed, read it again next time
+			account_cache.invalidate(lambda key: key[0] == filter_format('uid=%s', [uid]))
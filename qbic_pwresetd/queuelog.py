@@ -0,0 +1,159 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# Log records are put in a bounded queue and written by a background
+# thread, so a slow syslog or console never blocks the requests. When the
+# queue is full records are dropped and counted. The message is formatted
+# by the background thread too. Same idea as QueueHandler and
+# QueueListener from python 3 logging.handlers
+
+import logging
+
+from Queue import Full
+from threading import Lock, Thread
+
+from .metrics import registry as metrics
+
+class LogContext(logging.Filter):
+
+	"""
+	Adds the prefix attribute to the records, e.g. who is connected. As a
+	logger filter it runs when the record is created, not when written
+	"""
+
+	def __init__(self):
+		logging.Filter.__init__(self)
+		self.prefix = ''
+
+	def filter(self, record):
+		record.prefix = self.prefix
+		return True
+
+class QueueHandler(logging.Handler):
+
+	"""
+	limit, if not None, is the most records queued: it can be changed
+	while the daemon runs, unlike the maxsize of the queue, which also
+	limits it
+	"""
+
+	def __init__(self, queue, limit = None):
+		logging.Handler.__init__(self)
+		self.queue = queue
+		self.limit = limit
+		self.dropped = 0
+		self._unreported = 0
+		self._lock_dropped = Lock()
+		self._exc_formatter = logging.Formatter()
+
+	def prepare(self, record):
+		if record.exc_info:
+			# tracebacks can't wait, the frames change meanwhile
+			record.exc_text = self._exc_formatter.formatException(record.exc_info)
+			record.exc_info = None
+		return record
+
+	def _full(self):
+		# a few more than limit if several threads log at once, no big deal
+		return self.queue.full() or (self.limit is not None and self.queue.qsize() >= self.limit)
+
+	def _put(self, record):
+		try:
+			if self._full():
+				raise Full
+			self.queue.put_nowait(record)
+			return True
+		except Full:
+			with self._lock_dropped:
+				self.dropped += 1
+				self._unreported += 1
+			metrics.inc('pwresetd_log_dropped_total')
+			return False
+
+	def emit(self, record):
+		try:
+			if self._unreported > 0 and not self._full():
+				with self._lock_dropped:
+					n = self._unreported
+					self._unreported = 0
+				warning = logging.LogRecord(record.name, logging.WARNING, __file__, 0,
+						'%d log message(s) dropped, the log queue was full', (n,), None)
+				warning.prefix = ''
+				if not self._put(warning):
+					# filled up meanwhile, report them later
+					with self._lock_dropped:
+						self._unreported += n
+			self._put(self.prepare(record))
+		except (KeyboardInterrupt, SystemExit):
+			raise
+		except:
+			self.handleError(record)
+		return
+
+class QueueListener(object):
+
+	"""
+	Writes the records from the queue with the handlers configured for
+	the name of the logger they come from
+	"""
+
+	_sentinel = None
+
+	def __init__(self, queue, routes):
+		self.queue = queue
+		# logger name -> list of handlers
+		self.routes = dict([(name, list(handlers)) for (name, handlers) in routes])
+		self._thread = None
+
+	def set_handlers(self, name, handlers):
+		self.routes[name] = list(handlers)
+		return
+
+	def handle(self, record):
+		for h in self.routes.get(record.name, ()):
+			if record.levelno >= h.level:
+				h.handle(record)
+		return
+
+	def _run(self):
+		while True:
+			record = self.queue.get()
+			if record is self._sentinel:
+				return
+			self.handle(record)
+
+	def start(self):
+		self._thread = Thread(target = self._run, name = 'log-listener')
+		self._thread.daemon = True
+		self._thread.start()
+		return
+
+	def stop(self):
+		"""write what is still queued and stop the thread"""
+		if self._thread is None:
+			return
+		# put() blocks until there's room, nothing is dropped while stopping
+		self.queue.put(self._sentinel)
+		self._thread.join()
+		self._thread = None
+		return
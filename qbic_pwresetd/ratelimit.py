@@ -0,0 +1,116 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# Token buckets limiting how often a command can be used for the same
+# account or by the same client, checked before the command does any work
+
+from collections import OrderedDict
+from time import time
+
+def parse_limit(value):
+	"""`N/seconds' -> (N, seconds), N requests at most in a burst, refilled in seconds"""
+	try:
+		(count, seconds) = value.split('/', 1)
+		(count, seconds) = (int(count), float(seconds))
+	except ValueError:
+		raise ValueError('`%s\' is not a valid limit, must be N/seconds' % value)
+	if count <= 0 or seconds <= 0:
+		raise ValueError('`%s\' is not a valid limit, N and seconds must be positive' % value)
+	return (count, seconds)
+
+class TokenBuckets(object):
+
+	"""
+	One bucket of burst tokens per key, refilled at rate tokens per
+	second. A bucket full again is the same as no bucket at all, so it's
+	dropped, keeping only the keys used recently
+	"""
+
+	def __init__(self, burst, seconds, max_keys = 10000):
+		self.burst = float(burst)
+		self.rate = burst / float(seconds)
+		self.max_keys = max_keys
+		# key -> (tokens, time of the last update), least recently used first
+		self._buckets = OrderedDict()
+
+	def __len__(self):
+		return len(self._buckets)
+
+	def _tokens(self, bucket, now):
+		return min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+	def available(self, key, now):
+		bucket = self._buckets.get(key)
+		return self.burst if bucket is None else self._tokens(bucket, now)
+
+	def allow(self, key, now = None, take = True):
+		"""True if key has a token left, taking it unless take is False"""
+		if now is None:
+			now = time()
+		tokens = self.available(key, now)
+		allowed = tokens >= 1
+		if allowed and take:
+			self._buckets.pop(key, None)
+			self._buckets[key] = (tokens - 1, now)
+			self._evict(now)
+		return allowed
+
+	def _evict(self, now):
+		buckets = self._buckets
+		while len(buckets) > 0:
+			(key, bucket) = next(buckets.iteritems())
+			# beyond max_keys the oldest go even if not full yet
+			if len(buckets) <= self.max_keys and self._tokens(bucket, now) < self.burst:
+				return
+			del buckets[key]
+		return
+
+class RateLimiter(object):
+
+	"""
+	limits maps (command, kind) to (N, seconds), kind being 'account' or
+	'peer'. Commands and kinds not in it are not limited
+	"""
+
+	def __init__(self, limits, max_keys = 10000):
+		self.limits = dict(limits)
+		self._buckets = dict([(k, TokenBuckets(n, s, max_keys)) for (k, (n, s)) in limits.iteritems()])
+
+	def check(self, cmd, peer, account = None, now = None):
+		"""
+		the kind of the limit exceeded, None if the command is allowed.
+		Tokens are taken only if allowed by all the limits
+		"""
+		if now is None:
+			now = time()
+		checks = []
+		for (kind, key) in [('account', account), ('peer', peer)]:
+			buckets = self._buckets.get((cmd, kind))
+			if key is None or buckets is None:
+				continue
+			if not buckets.allow(key, now, take = False):
+				return kind
+			checks.append((buckets, key))
+		for (buckets, key) in checks:
+			buckets.allow(key, now)
+		return None
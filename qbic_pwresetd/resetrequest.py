@@ -22,8 +22,6 @@
 
 __author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>, Erhan Kenar <erhan.kenar@uni-tuebingen.de>'
 
-import MySQLdb
-import sqlite3
 import struct
 import sys
 
@@ -34,6 +32,29 @@ from calendar import timegm
 from traceback import format_exc
 
 datetime_format = '%Y-%m-%d %H:%M:%S'
+
+# the driver of an engine is imported only when that engine is used
+_engine_modules = {
+	'mysql': 'MySQLdb',
+	'sqlite': 'sqlite3',
+}
+_loaded_modules = {}
+
+def db_module(engine):
+	"""the DB API module for engine, imported on first use"""
+	m = _loaded_modules.get(engine)
+	if m is None:
+		try:
+			name = _engine_modules[engine]
+		except KeyError:
+			raise ValueError('Database module `%s\' not suported' % engine)
+		m = _loaded_modules[engine] = __import__(name)
+	return m
+
+def db_errors():
+	"""the base exceptions of the drivers imported so far, to use in except"""
+	return tuple([m.Error for m in _loaded_modules.itervalues()])
+
 rr_t = struct.Struct('<I?Q')
 class ResetRequest:
 	def __init__(self, *args, **kwargs):
@@ -102,7 +123,7 @@ class DBManager:
 		try:
 			
 			if engine == 'mysql':
-				self.db_module = MySQLdb
+				self.db_module = db_module(engine)
 				self._placeholder = r'%s'
 				self.uri = uri
 				self.rrequests_table = kwargs['rrequests_table']
@@ -112,7 +133,7 @@ class DBManager:
 				if 'unix_socket' in kwargs:
 					self.unix_socket = kwargs['unix_socket']
 			elif engine == 'sqlite':
-				self.db_module = sqlite3
+				self.db_module = db_module(engine)
 				self._placeholder = r'?'
 				self.uri = uri
 				self.rrequests_table = kwargs['rrequests_table']
@@ -169,8 +190,12 @@ class DBManager:
 			# self initialize the DB
 			try:
 				self.db_cursor.execute(r'CREATE TABLE %s(request_id INTEGER PRIMARY KEY AUTOINCREMENT, account_name TEXT NOT NULL, secret_code TEXT UNIQUE NOT NULL, creation_timestamp TEXT NOT NULL, reset_duration INT NOT NULL, is_active INT NOT NULL)' % self.rrequests_table)
-			except sqlite3.OperationalError as e:
+			except self.db_module.OperationalError as e:
 				pass
+			# GETREQUEST looks requests up by account name
+			self.db_cursor.execute(r'CREATE INDEX IF NOT EXISTS {table}_account_name ON {table}(account_name)'.format(
+					table = self.rrequests_table
+			))
 		return
 
 	def disconnect(self):
@@ -192,10 +217,29 @@ class DBManager:
 		fetch_results = self.db_cursor.fetchone()
 		if fetch_results is None:
 			return None
-		#fetch_results = self.db_cursor.fetchmany(10)
-		# TODO return a ResetRequest object instead this class should abstract the DB
-		# not just dumping it to the caller
-		(r_id, username, secret, ctime, duration, active) = fetch_results
+		return self._row_to_request(fetch_results)
+
+	def get_requests_by_account(self, account_names, limit = None):
+		"""oldest first, only the newest limit ones if limit is not None"""
+		if len(account_names) == 0:
+			return []
+		select_cmd = r'SELECT * FROM {table} WHERE account_name IN ({placeholders}) ORDER BY request_id DESC'.format(
+				table = self.rrequests_table,
+				placeholders = ', '.join([self._placeholder] * len(account_names))
+		)
+		if limit is not None:
+			select_cmd += ' LIMIT %d' % limit
+		self.db_cursor.execute(select_cmd, tuple(account_names))
+		return [self._row_to_request(x) for x in reversed(self.db_cursor.fetchall())]
+
+	def list_requests(self, limit=50):
+		fetch_results = []
+		self.db_cursor.execute(r'SELECT * FROM ' + self.rrequests_table)
+		fetch_results = self.db_cursor.fetchmany(limit)
+		return [self._row_to_request(x) for x in fetch_results]
+
+	def _row_to_request(self, row):
+		(r_id, username, secret, ctime, duration, active) = row
 		if self.db_module.__name__ == 'sqlite3':
 			ctime = datetime.strptime(ctime, datetime_format)
 			active = bool(active)
@@ -207,23 +251,16 @@ class DBManager:
 				creation_timestamp = ctime
 		)
 
-	def list_requests(self, limit=50):
-		fetch_results = []
-		self.db_cursor.execute(r'SELECT * FROM ' + self.rrequests_table)
-		fetch_results = self.db_cursor.fetchmany(limit)
-		ret = []
-		for (r_id, username, secret, ctime, duration, active)  in fetch_results:
-			if self.db_module.__name__ == 'sqlite3':
-				ctime = datetime.strptime(ctime, datetime_format)
-				active = bool(active)
-			ret.append(ResetRequest(
-					account_name = username,
-					secret_code = secret,
-					duration = duration,
-					active = active,
-					creation_timestamp = ctime
-			))
-		return ret
+	def list_secrets(self, batch_size = 1000):
+		# generator, fetch the secrets in batches to keep memory usage low
+		# even with a big table
+		self.db_cursor.execute(r'SELECT secret_code FROM ' + self.rrequests_table)
+		fetch_results = self.db_cursor.fetchmany(batch_size)
+		while len(fetch_results) > 0:
+			for (secret,) in fetch_results:
+				yield secret
+			fetch_results = self.db_cursor.fetchmany(batch_size)
+		return
 
 	def update_request_by_secret(self, secret_code, field_name, field_value):
 		update_cmd = r'UPDATE {table} SET {field} = {placeholder} WHERE secret_code = {placeholder}'.format(
@@ -231,7 +268,7 @@ class DBManager:
 				field = field_name,
 				placeholder = self._placeholder
 		)
-		if self.db_module == MySQLdb:
+		if self.db_module.__name__ == 'MySQLdb':
 			self.db_cursor.execute(r'LOCK TABLES {table} WRITE'.format(table = self.rrequests_table))
 		self.db_cursor.execute(update_cmd, (field_value, secret_code))
 		ret = self.db_cursor.rowcount
@@ -247,7 +284,7 @@ class DBManager:
 			self.db_connection.rollback()
 		else:
 			self.db_connection.commit()
-		if self.db_module == MySQLdb:
+		if self.db_module.__name__ == 'MySQLdb':
 			# looks like it will commit in the moment we unlock the tables, so do it now
 			self.db_cursor.execute(r'UNLOCK TABLES')
 		return ret
@@ -0,0 +1,84 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+import struct
+
+from hashlib import sha256
+from math import ceil, exp, log
+
+hash_pair_t = struct.Struct('<QQ')
+
+class SecretFilter(object):
+
+	"""
+	Bloom filter holding the secret codes known to the database.
+	A negative answer is certain, so the caller can reject the secret
+	without querying the database. A positive answer may be wrong with
+	probability false_positive_rate() and must be confirmed by the database.
+	"""
+
+	def __init__(self, capacity, error_rate = 0.001):
+		if capacity <= 0:
+			raise ValueError('capacity must be a positive integer, got %s' % repr(capacity))
+		if not 0 < error_rate < 1:
+			raise ValueError('error_rate must be between 0 and 1, got %s' % repr(error_rate))
+		self.capacity = capacity
+		self.error_rate = error_rate
+		# optimal number of bits and hash functions for the requested capacity
+		self.nbits = int(ceil(-capacity * log(error_rate) / (log(2) ** 2)))
+		self.nhashes = max(1, int(round(float(self.nbits) / capacity * log(2))))
+		self.bits = bytearray((self.nbits + 7) // 8)
+		self.count = 0
+
+	def __len__(self):
+		return self.count
+
+	def _positions(self, secret):
+		if not isinstance(secret, bytes):
+			secret = secret.encode('utf-8')
+		# double hashing: k positions out of two independent 64 bit values
+		(h1, h2) = hash_pair_t.unpack(sha256(secret).digest()[:hash_pair_t.size])
+		return [(h1 + i * h2) % self.nbits for i in range(self.nhashes)]
+
+	def add(self, secret):
+		for p in self._positions(secret):
+			self.bits[p >> 3] |= 1 << (p & 7)
+		self.count += 1
+		return
+
+	def __contains__(self, secret):
+		for p in self._positions(secret):
+			if not self.bits[p >> 3] & (1 << (p & 7)):
+				return False
+		return True
+
+	def size(self):
+		"""memory used by the bit array, in bytes"""
+		return len(self.bits)
+
+	def false_positive_rate(self):
+		"""estimated false positive rate for the current number of secrets"""
+		return (1 - exp(-float(self.nhashes) * self.count / self.nbits)) ** self.nhashes
+
+	def saturated(self):
+		return self.count > self.capacity
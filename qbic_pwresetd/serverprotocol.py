@@ -25,7 +25,7 @@ import re
 import struct
 
 from . import readpackets, sendpackets, ProtocolError, BadRequest, a_ack, a_nak, a_badrequest, a_error
-from . import crta_t, unpack_uint, uint_t
+from . import crta_t, packet_header_t, packet_size, unpack_uint, uint_t
 from base64 import standard_b64encode, standard_b64decode
 
 
@@ -66,6 +66,29 @@ def _parse_create_request(args):
 	
 	return [first, secret, duration, enabled]
 
+def _parse_get_request(args):
+	# args == 'username=qbicqbc01'
+	# args == 'email=standard_b64encode('user@example.com')'
+	# args == 'secret=secret'
+	try:
+		(selector, value) = args[0].split('=', 1)
+	except ValueError:
+		raise BadRequest('argument must start with username=|email=|secret=')
+	if len(value) <= 0:
+		raise BadRequest('no %s specified' % selector)
+	if selector == 'email':
+		try:
+			value = standard_b64decode(value)
+		except TypeError:
+			raise BadRequest('cannot decode email address in: %s' % repr(args[0]))
+	elif selector == 'secret':
+		m = secret_sanitize_re.search(value)
+		if m is not None:
+			raise BadRequest('found forbidden character(s) in secret: %s' % repr(value[m.start():m.end()]))
+	elif selector != 'username':
+		raise BadRequest('argument must start with username=|email=|secret=')
+	return ['%s=%s' % (selector, value)]
+
 def _parse_list_requests(args):
 	try:
 		limit = unpack_uint(args[0])
@@ -103,16 +126,32 @@ def _parse_send_email(args):
 		raise BadRequest('SENDEMAIL: requires at least 2 arguments, %d given' % len(args))
 	return [args[0].lower(), args[1:]]
 
+def _parse_profile(args):
+	# args == 'START seconds requests memory' | 'STOP' | 'STATUS'
+	action = args[0].upper()
+	if action in ['STOP', 'STATUS'] and len(args) == 1:
+		return [action, 0, 0, False]
+	if action != 'START' or len(args) != 4:
+		raise BadRequest('arguments must be START seconds requests memory, STOP or STATUS')
+	try:
+		(seconds, requests, memory) = [int(x) for x in args[1:]]
+	except ValueError:
+		raise BadRequest('seconds, requests and memory must be integers')
+	if seconds < 0 or requests < 0:
+		raise BadRequest('seconds and requests must not be negative')
+	return [action, seconds, requests, memory != 0]
+
 _cmd2parse_funct = {
 	'CREATEREQUEST': (_parse_create_request, 3),
-#	'GETREQUEST': (_parse_get_request, 1),  # Not implemented yet
+	'GETREQUEST': (_parse_get_request, 1),
 	'LISTREQUESTS': (_parse_list_requests, 1),
 	'RESETPW': (_parse_reset_password, 3),
 	'ENABLEREQUEST': (_parse_enable_request, 1),
 	'DISABLEREQUEST': (_parse_enable_request, 1),
 	'SENDEMAIL': (_parse_send_email, '?'),
+	'PROFILE': (_parse_profile, '?'),
 }
-cmd_list = _cmd2parse_funct.keys() + ['TESTPROTOCOL','KTHXBYE']
+cmd_list = _cmd2parse_funct.keys() + ['TESTPROTOCOL', 'STATS', 'KTHXBYE']
 
 def get_command(conn):
 	line = readpackets(conn)
@@ -165,6 +204,17 @@ def _answer_list_requests(status, data):
 	answer += uint_t.pack(len(index)) + ''.join(uint_t.pack(x) for x in index) + raw_data
 	return answer
 
+def fit_list_requests(requests, maxpackets):
+	"""the newest of requests (oldest first) whose ACK answer fits in maxpackets"""
+	room = maxpackets * packet_size - packet_header_t.size - len(a_ack) - 1 - uint_t.size
+	n = 0
+	for r in reversed(requests):
+		room -= uint_t.size + len(r.pack())
+		if room < 0:
+			break
+		n += 1
+	return requests[len(requests) - n:]
+
 def _answer_enable_request(status, data):
 	(secret, enabled) = data
 	return '%s %s\0%s' % (status, secret, str(enabled))
@@ -179,13 +229,15 @@ def _answer_send_email(status, data):
 
 _cmd2answer = {
 	'CREATEREQUEST': (_simple_answer, []),
-#	'GETREQUEST': (_answer_get_request, []),  # Not implemented yet
+	'GETREQUEST': (_answer_list_requests, [a_ack]),
 	'LISTREQUESTS': (_answer_list_requests, [a_ack]),
 	'RESETPW': (_simple_answer, []),
 	'ENABLEREQUEST': (_answer_enable_request, [a_ack]),
 	'DISABLEREQUEST': (_answer_enable_request, [a_ack]),
 	'SENDEMAIL': (_answer_send_email, [a_ack, a_nak]),
 	'TESTPROTOCOL': (_simple_answer, []),
+	'STATS': (_simple_answer, []),
+	'PROFILE': (_simple_answer, []),
 }
 def send_answer(conn, status, answer, cmd = None):
 	if cmd is None:
@@ -0,0 +1,98 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# Secrets carrying their expiry time and a HMAC of it, so guessed, forged
+# or expired ones can be refused without a database query:
+#   key id . expiry (unix time, hex) . random (hex) . HMAC-SHA256 (hex, truncated)
+# The database stays the one deciding about the others: a valid signature
+# says nothing about the request being active or already used
+
+import hmac
+import re
+
+from hashlib import sha256
+from time import time
+
+signed_secret_re = re.compile(r'^([A-Za-z0-9_-]{1,16})\.([0-9a-f]{8})\.([0-9a-f]{32})\.([0-9a-f]{32})$')
+key_id_re = re.compile(r'^[A-Za-z0-9_-]{1,16}$')
+min_key_length = 32
+
+def looks_signed(secret):
+	return signed_secret_re.match(secret) is not None
+
+def load_keys(path):
+	"""
+	One `key_id key' per line, # for comments. The first key signs the new
+	secrets, all of them are accepted: to rotate add the new key on top and
+	remove the old one when the secrets signed with it expired
+	"""
+	keys = []
+	with open(path, 'r') as f:
+		for (n, line) in enumerate(f, 1):
+			line = line.strip()
+			if line == '' or line.startswith('#'):
+				continue
+			try:
+				(kid, key) = line.split(None, 1)
+			except ValueError:
+				raise ValueError('%s:%d: expected `key_id key\'' % (path, n))
+			if key_id_re.match(kid) is None:
+				raise ValueError('%s:%d: key id must be 1 to 16 letters, digits, - or _' % (path, n))
+			if len(key) < min_key_length:
+				raise ValueError('%s:%d: key must be at least %d characters long' % (path, n, min_key_length))
+			if kid in [x[0] for x in keys]:
+				raise ValueError('%s:%d: key id %s used twice' % (path, n, kid))
+			keys.append((kid, key))
+	if len(keys) == 0:
+		raise ValueError('%s: no keys found' % path)
+	return keys
+
+class SecretSigner(object):
+
+	def __init__(self, keys):
+		self.kid = keys[0][0]
+		self.keys = dict(keys)
+
+	def _mac(self, kid, expiry, random):
+		msg = '%s.%s.%s' % (kid, expiry, random)
+		return hmac.new(self.keys[kid], msg, sha256).hexdigest()[:32]
+
+	def sign(self, expires, random):
+		"""expires is a unix time, random 32 hex digits"""
+		expiry = '%08x' % int(expires)
+		return '%s.%s.%s.%s' % (self.kid, expiry, random, self._mac(self.kid, expiry, random))
+
+	def check(self, secret, now = None):
+		"""None if valid, else why not: malformed, unknown_key, forged or expired"""
+		m = signed_secret_re.match(secret)
+		if m is None:
+			return 'malformed'
+		(kid, expiry, random, mac) = m.groups()
+		if kid not in self.keys:
+			return 'unknown_key'
+		if not hmac.compare_digest(mac, self._mac(kid, expiry, random)):
+			return 'forged'
+		# trusted only now that the MAC matched
+		if int(expiry, 16) <= (time() if now is None else now):
+			return 'expired'
+		return None
@@ -0,0 +1,119 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# Where the time of a request goes. start() begins a trace for the current
+# thread, span() times a phase of it and finish() returns the trace.
+# Without a trace, i.e. when tracing is disabled or in other threads,
+# span() returns a shared object doing nothing
+
+from threading import local
+from time import time
+
+enabled = False
+_local = local()
+
+class _NullSpan(object):
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, tb):
+		return False
+
+_null_span = _NullSpan()
+
+class _Span(object):
+
+	def __init__(self, trace, name):
+		self.trace = trace
+		self.name = name
+
+	def __enter__(self):
+		t = self.trace
+		t.stack.append(self.name)
+		self.start = time()
+		return self
+
+	def __exit__(self, exc_type, exc_value, tb):
+		t = self.trace
+		t.add('/'.join(t.stack), time() - self.start, len(t.stack) == 1)
+		t.stack.pop()
+		return False
+
+class Trace(object):
+
+	def __init__(self, name):
+		self.name = name
+		self.start = time()
+		self.end = None
+		self.stack = []
+		# path -> [seconds, calls], the same phase repeated is summed up
+		self.phases = {}
+		self.order = []
+		self.traced = 0.0
+
+	def add(self, path, seconds, top_level):
+		p = self.phases.get(path)
+		if p is None:
+			p = self.phases[path] = [0.0, 0]
+			self.order.append(path)
+		p[0] += seconds
+		p[1] += 1
+		if top_level:
+			self.traced += seconds
+		return
+
+	def total(self):
+		return (self.end or time()) - self.start
+
+	def breakdown(self):
+		"""one line, phases in the order they started, nested ones as outer/inner"""
+		parts = []
+		for path in self.order:
+			(seconds, calls) = self.phases[path]
+			if calls > 1:
+				parts.append('%s=%.3fs/%d' % (path, seconds, calls))
+			else:
+				parts.append('%s=%.3fs' % (path, seconds))
+		parts.append('untraced=%.3fs' % max(0.0, self.total() - self.traced))
+		return '%s total=%.3fs %s' % (self.name, self.total(), ' '.join(parts))
+
+def start(name):
+	if not enabled:
+		return None
+	t = _local.trace = Trace(name)
+	return t
+
+def finish():
+	t = getattr(_local, 'trace', None)
+	if t is not None:
+		t.end = time()
+		_local.trace = None
+	return t
+
+def span(*name):
+	"""span('pwd_score') or span('db', 'get_request') for db:get_request"""
+	t = getattr(_local, 'trace', None)
+	if t is None:
+		return _null_span
+	return _Span(t, ':'.join(name))
@@ -0,0 +1,126 @@
+# qbic-pwresetd a password reset daemon for the QBiC services
+# Copyright (C) 2016  Sven Nahnsen <sven.nahnsen@uni-tuebingen.de>
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+# --------------------------------------------------------------------------
+# $Author: Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de> $
+# --------------------------------------------------------------------------
+
+__author__ = 'Enrico Tagliavini <enrico.tagliavini@uni-tuebingen.de>'
+
+# systemd watchdog pings from the main loop, and how long the loop is kept
+# busy. The pings are sent only when the loop comes back, so a request
+# stuck in LDAP or anywhere else gets the daemon restarted. A background
+# thread reports the stall meanwhile, in the status shown by systemctl and
+# in the metrics, but never pings
+
+import os
+
+from threading import Event, Thread
+from time import time
+
+from .metrics import registry as metrics
+
+def watchdog_timeout(environ = os.environ):
+	"""WatchdogSec= in seconds, None if the watchdog is not enabled for this process"""
+	usec = environ.get('WATCHDOG_USEC')
+	if not usec:
+		return None
+	pid = environ.get('WATCHDOG_PID')
+	if pid and int(pid) != os.getpid():
+		return None
+	return int(usec) / 1000000.0
+
+class Watchdog(object):
+
+	def __init__(self, notify, timeout = None, stall_threshold = 0, warn = None):
+		self._notify = notify
+		self.set_timeout(timeout)
+		self.stall_threshold = stall_threshold
+		self._warn = warn
+		self.last_ping = 0
+		self.busy_since = None
+		self.activity = None
+		self.last_busy = 0.0
+		self.max_busy = 0.0
+		self._stalled = False
+		self._thread = None
+		self._stop_event = Event()
+
+	def set_timeout(self, timeout):
+		# the loop must come back at least this often, pinging twice per
+		# timeout as systemd suggests. None without watchdog
+		self.interval = timeout / 2.0 if timeout else None
+		return
+
+	def busy(self, activity):
+		"""the loop starts working on activity, until the next beat()"""
+		self.activity = activity
+		self.busy_since = time()
+		return
+
+	def beat(self):
+		"""the loop is about to wait for work again"""
+		now = time()
+		if self.busy_since is not None:
+			self.last_busy = now - self.busy_since
+			self.max_busy = max(self.max_busy, self.last_busy)
+			metrics.observe('pwresetd_loop_busy_seconds', self.last_busy)
+			self.busy_since = None
+		status = 'STATUS=Accepting connections, last busy %.3fs, max %.3fs' % (self.last_busy, self.max_busy)
+		if self.interval is not None and now - self.last_ping >= self.interval / 2:
+			self.last_ping = now
+			self._notify('WATCHDOG=1\n' + status)
+		elif self._stalled:
+			# replace the stall status
+			self._notify(status)
+		if self._stalled:
+			self._stalled = False
+			if self._warn is not None:
+				self._warn('Main loop back after %.1fs %s' % (self.last_busy, self.activity))
+		return
+
+	def _run(self):
+		while not self._stop_event.wait(self.stall_threshold / 2.0):
+			since = self.busy_since
+			if since is None or self._stalled:
+				continue
+			stalled = time() - since
+			if stalled >= self.stall_threshold:
+				self._stalled = True
+				metrics.inc('pwresetd_loop_stalls_total')
+				msg = 'Main loop stalled for %.1fs %s' % (stalled, self.activity)
+				self._notify('STATUS=' + msg)
+				if self._warn is not None:
+					self._warn(msg)
+		return
+
+	def start(self):
+		"""start the stall monitor, if a threshold is set"""
+		if self.stall_threshold <= 0:
+			return
+		self._stop_event.clear()
+		self._thread = Thread(target = self._run, name = 'stall-monitor')
+		self._thread.daemon = True
+		self._thread.start()
+		return
+
+	def stop(self):
+		if self._thread is not None:
+			self._stop_event.set()
+			self._thread.join()
+			self._thread = None
+		return
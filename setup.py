@@ -32,6 +32,8 @@ setup(
 	scripts = [
 		'src/qbic-pwresetd',
 		'src/pwreset',
+		'src/pwbreached',
+		'src/pwaudit',
 	],
 	zip_safe = False,
 )
@@ -0,0 +1,4 @@
+-- Add the account_name index used by GETREQUEST to a database created
+-- before the index was part of create_request_db.sql
+-- Usage: mysql -u root -p dbname < add_account_name_index.sql
+ALTER TABLE `reset_requests` ADD KEY `account_name` (`account_name`);
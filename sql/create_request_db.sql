@@ -11,6 +11,7 @@ CREATE TABLE `reset_requests` (
   `reset_duration` int(11) NOT NULL DEFAULT '48',
   `is_active` tinyint(1) NOT NULL DEFAULT '0',
   PRIMARY KEY (`request_id`),
-  UNIQUE KEY `secret_code` (`secret_code`)
+  UNIQUE KEY `secret_code` (`secret_code`),
+  KEY `account_name` (`account_name`)
 ) ENGINE=InnoDB AUTO_INCREMENT=17 DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
 
@@ -0,0 +1,125 @@
+import os
+import shutil
+import socket
+import tempfile
+
+from time import sleep, time
+
+from qbic_pwresetd import a_busy
+from qbic_pwresetd.admission import Admission
+from qbic_pwresetd.clientprotocol import get_answer, send_request
+from qbic_pwresetd.metrics import registry as metrics
+
+def connect(path):
+	s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	s.settimeout(5)
+	s.connect(path)
+	send_request(s, 'TESTPROTOCOL', ['hello'])
+	return s
+
+def admission_test():
+	tmpdir = tempfile.mkdtemp()
+	path = os.path.join(tmpdir, 'sock')
+	listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	listen_socket.bind(path)
+	listen_socket.listen(1)
+	admission = Admission(1, 0.5)
+	admission.add_listener('portal', listen_socket)
+	admission.start()
+	clients = []
+	try:
+		metrics.clear()
+		clients.append(connect(path))
+		# the first one is being served, the next one waits
+		first = admission.get()
+		assert first is not None
+		assert first[2] == 'portal'
+		clients.append(connect(path))
+		sleep(0.2)
+		shed = connect(path)
+		assert get_answer(shed, 'TESTPROTOCOL')[0] == a_busy
+		assert metrics.counter('pwresetd_shed_total', reason = 'queue_full', socket = 'portal') == 1
+
+		# the second one waited too long
+		sleep(0.5)
+		assert admission.get() is None
+		assert get_answer(clients[1], 'TESTPROTOCOL')[0] == a_busy
+		assert metrics.counter('pwresetd_shed_total', reason = 'queue_timeout', socket = 'portal') == 1
+		first[0].close()
+	finally:
+		admission.stop()
+		listen_socket.shutdown(socket.SHUT_RDWR)
+		listen_socket.close()
+		for c in clients:
+			c.close()
+		shutil.rmtree(tmpdir)
+
+def set_depth_test():
+	tmpdir = tempfile.mkdtemp()
+	path = os.path.join(tmpdir, 'sock')
+	listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	listen_socket.bind(path)
+	listen_socket.listen(5)
+	admission = Admission(3, 0)
+	admission.add_listener('portal', listen_socket)
+	admission.start()
+	clients = []
+	try:
+		metrics.clear()
+		for i in range(3):
+			clients.append(connect(path))
+		sleep(0.2)
+		# more than the new depth are waiting already
+		admission.set_depth(1)
+		shed = connect(path)
+		assert get_answer(shed, 'TESTPROTOCOL')[0] == a_busy
+		assert metrics.counter('pwresetd_shed_total', reason = 'queue_full', socket = 'portal') == 1
+		# the ones waiting are still served
+		for i in range(3):
+			c = admission.get(1)
+			assert c is not None
+			c[0].close()
+		clients.append(connect(path))
+		sleep(0.2)
+		c = admission.get(1)
+		assert c is not None
+		c[0].close()
+		assert metrics.counter('pwresetd_shed_total', reason = 'queue_full', socket = 'portal') == 1
+	finally:
+		admission.stop()
+		listen_socket.shutdown(socket.SHUT_RDWR)
+		listen_socket.close()
+		for c in clients:
+			c.close()
+		shutil.rmtree(tmpdir)
+
+def accept_error_test():
+	listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	listen_socket.close()
+	warnings = []
+	admission = Admission(1, 0, warnings.append)
+	admission.add_listener('portal', listen_socket)
+	admission.start()
+	sleep(0.05)
+	admission.stop()
+	admission.listeners[0].thread.join()
+	# reported, without spinning
+	assert len(warnings) == 1
+	assert warnings[0].startswith('Error accepting a connection on portal: ')
+
+def weights_test():
+	admission = Admission(100, 0)
+	admission.add_listener('portal', None, 3)
+	admission.add_listener('admin', None, 1)
+	for l in admission.listeners:
+		for i in range(8):
+			l.queue.put(('conn', l.name, time()))
+	order = [admission.get()[2] for i in range(8)]
+	assert order.count('portal') == 6
+	assert order.count('admin') == 2
+	# the admin ones left are served when nothing else waits
+	order = [admission.get()[2] for i in range(8)]
+	assert order.count('portal') == 2
+	assert order[-4:] == ['admin'] * 4
+	# nothing left, back after the timeout
+	assert admission.get(0.01) is None
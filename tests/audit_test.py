@@ -0,0 +1,29 @@
+from qbic_pwresetd.audit import audit, format_report, parse_line, score_lines
+from qbic_pwresetd.pw_check import pwd_score
+
+lines = [
+	'enricotagliavinirocks\tEnrico Tagliavini\n',
+	'Fooyeeph7eiw\tEnrico Tagliavini\n',
+	'password15\tAlice Liddell\n',
+	'\n',
+	'with spaces and no name\n',
+] * 50
+
+def parse_line_test():
+	assert parse_line('pass word\tGiven Family Name\n') == ('pass word', ['Given', 'Family', 'Name'])
+	assert parse_line('password\n') == ('password', [])
+	assert parse_line('\r\n') is None
+
+def audit_test():
+	expected = score_lines(lines)
+	assert expected.total == 200
+	assert expected.scores[int(pwd_score('Fooyeeph7eiw', ['Enrico', 'Tagliavini'])[0])] >= 50
+	# chunks much smaller than the input so the read ahead window fills up
+	res = audit(iter(lines), workers = 2, chunk_size = 7)
+	assert res.total == expected.total
+	assert res.scores == expected.scores
+	assert res.reasons == expected.reasons
+	assert res.accepted(-1) == res.total
+	report = format_report(res, [0, 12])
+	assert '200 passwords' in report
+	assert 'min_score = 12' in report
@@ -0,0 +1,77 @@
+import os
+
+from hashlib import sha1
+from nose.tools import with_setup
+from random import Random
+from tempfile import mkstemp
+from time import time
+
+from qbic_pwresetd import pw_check
+from qbic_pwresetd.breached import BreachedIndex, build_index
+from qbic_pwresetd.pw_check import init_breached_index, pwd_score
+
+index_path = None
+breached = ['123456', 'password', 'Tr0ub4dor&3', u'p\xe4ssw\xf6rd']
+
+def hash_lines():
+	rnd = Random(7)
+	lines = ['# comment', '']
+	for p in breached:
+		if isinstance(p, unicode):
+			p = p.encode('utf-8')
+		lines.append('%s:%d' % (sha1(p).hexdigest().upper(), rnd.randint(1, 1000)))
+	for i in xrange(5000):
+		lines.append(sha1('random%d' % i).hexdigest())
+	# duplicates must be written once
+	lines += lines[2:12]
+	rnd.shuffle(lines)
+	return lines
+
+def setup_index():
+	global index_path
+	(fd, index_path) = mkstemp(prefix = 'pwresetd_breached_test')
+	os.close(fd)
+	# tiny chunks to go through the merge of many sorted runs
+	assert build_index(hash_lines(), index_path, chunk_size = 97) == 5004
+
+def teardown_index():
+	init_breached_index(None)
+	os.unlink(index_path)
+
+@with_setup(setup_index, teardown_index)
+def lookup_test():
+	index = BreachedIndex(index_path)
+	assert len(index) == 5004
+	for p in breached:
+		assert p in index, p
+	for i in xrange(0, 5000, 7):
+		assert 'random%d' % i in index
+	# case matters, the hash is of the password as typed
+	assert 'PASSWORD' not in index
+	assert 'random5000' not in index
+	assert '' not in index
+	start = time()
+	for i in xrange(10000):
+		'random%d' % i in index
+	# microseconds each, leave plenty of margin for slow machines
+	assert time() - start < 1
+	index.close()
+
+@with_setup(setup_index, teardown_index)
+def corrupted_index_test():
+	with open(index_path, 'r+b') as f:
+		f.truncate(os.path.getsize(index_path) - 1)
+	try:
+		BreachedIndex(index_path)
+	except ValueError:
+		return
+	assert False
+
+@with_setup(setup_index, teardown_index)
+def pwd_score_breached_test():
+	assert pwd_score('Tr0ub4dor&3', [])[0] >= 0
+	init_breached_index(index_path)
+	(score, reason) = pwd_score('Tr0ub4dor&3', [])
+	assert score == -1
+	assert 'breached' in reason
+	assert pwd_score('tr0ub4dor&3', [])[0] >= 0
@@ -1,5 +1,117 @@
+import os
+
+from nose.tools import with_setup
+from StringIO import StringIO
+from tempfile import mkstemp
+from time import time
+
+from qbic_pwresetd import fakeqbicldap
 from qbic_pwresetd.fakeqbicldap import *
 
+ldif = '''version: 1
+
+# a container, not an account
+dn: ou=people,o=example
+objectClass: organizationalUnit
+ou: people
+
+dn: uid=alice,ou=people,o=example
+objectClass: top
+objectClass: posixAccount
+uid: alice
+mail: Alice@Example.org
+sn: Liddell
+gecos: Alice
+ Liddell
+
+dn: uid=bob,ou=people,o=example
+objectclass: posixAccount
+uid: bob
+mail: bob@example.org
+mail: robert@example.org
+sn:: w5xiZXJ0
+'''
+
+def ldif_users(count):
+	for i in range(count):
+		yield 'dn: uid=user%d,ou=people,o=example\nobjectClass: posixAccount\nuid: user%d\nmail: user%d@example.org\n\n' % (i, i, i)
+
+def setup_ldif():
+	clear_fake_users()
+	for (dn, attrs) in parse_ldif(StringIO(ldif)):
+		add_fake_entry(dn, attrs)
+
+def teardown_ldif():
+	fakeqbicldap.latency = 0
+	init_ldap('fakeldap')
+
 def get_account_attrs_test():
 	add_fake_user(**example_user)
 	assert get_email_from_uid(example_user['uid'][0]) == example_user['mail'][0]
+	assert get_uid_from_email(example_user['mail'][0]) == example_user['uid']
+
+@with_setup(setup_ldif, teardown_ldif)
+def parse_ldif_test():
+	assert len(fake_ldap_users) == 3
+	alice = fake_ldap_users['uid=alice,ou=people,o=example']
+	# folded lines are joined dropping the leading space only
+	assert alice.get('gecos') == ['AliceLiddell']
+	assert alice.get('objectclass') == ['top', 'posixAccount']
+	assert fake_ldap_users['uid=bob,ou=people,o=example'].get('sn') == ['\xc3\x9cbert']
+
+@with_setup(setup_ldif, teardown_ldif)
+def search_filter_test():
+	def uids(search_filter):
+		return sorted([x['uid'][0] for x in get_account_attrs(search_filter, ['uid'])])
+	assert uids('uid=alice') == ['alice']
+	# mail matching ignores case
+	assert uids('(mail=alice@example.org)') == ['alice']
+	assert uids('(|(uid=alice)(mail=robert@example.org))') == ['alice', 'bob']
+	assert uids('(&(uid=bob)(sn=\\c3\\9cbert))') == ['bob']
+	assert uids('(&(uid=bob)(sn=Liddell))') == []
+	assert uids('(&(mail=*@example.org)(!(uid=bob)))') == ['alice']
+	assert uids('(sn=*)') == ['alice', 'bob']
+	# the organizational unit is not a posix account
+	assert uids('(objectClass=*)') == ['alice', 'bob']
+	assert uids('uid=nobody') == []
+	for bad in ['(uid=alice', '(&(uid=alice)', '(!(uid=a)(uid=b))', '(uidNumber>=10)']:
+		try:
+			get_account_attrs(bad, ['uid'])
+		except ValueError:
+			continue
+		assert False, bad
+
+@with_setup(setup_ldif, teardown_ldif)
+def search_attrs_test():
+	(dn, attrs) = search_accounts('uid=bob', ['mail', 'givenName'])[0]
+	assert dn == 'uid=bob,ou=people,o=example'
+	# missing attributes are not returned, like a real server does
+	assert attrs == {'mail': ['bob@example.org', 'robert@example.org']}
+	attrs['mail'].append('changed@example.org')
+	assert search_accounts('uid=bob', ['mail'])[0][1]['mail'] == ['bob@example.org', 'robert@example.org']
+
+@with_setup(setup_ldif, teardown_ldif)
+def reload_entry_test():
+	add_fake_entry('uid=bob,ou=people,o=example', {'objectClass': ['posixAccount'], 'uid': ['bob'], 'mail': ['new@example.org']})
+	assert get_uid_from_email('robert@example.org') == []
+	assert get_uid_from_email('new@example.org') == ['bob']
+
+@with_setup(setup_ldif, teardown_ldif)
+def load_ldif_uri_test():
+	(fd, path) = mkstemp(prefix = 'pwresetd_fakeldap_test', suffix = '.ldif')
+	try:
+		with os.fdopen(fd, 'w') as f:
+			for entry in ldif_users(10000):
+				f.write(entry)
+		init_ldap('fakeldap://' + path + '?latency=0.05')
+	finally:
+		os.unlink(path)
+	assert len(fake_ldap_users) == 10000
+	assert len(fake_ldap_indexes['mail']) == 10000
+	assert fakeqbicldap.latency == 0.05
+	start = time()
+	assert get_email_from_uid('user9999') == 'user9999@example.org'
+	assert time() - start >= 0.05
+	res = search_accounts_async('mail=user42@example.org', ['uid'])
+	assert not res.ready()
+	assert res.result()[0][1] == {'uid': ['user42']}
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+# loaded only when the config or a request needs them
+lazy_modules = ['MySQLdb', 'sqlite3', 'pwquality', 'passlib', 'pstats']
+# seconds, generous: it's to catch something heavy imported again at startup
+import_budget = 2.0
+
+check = '''
+import sys
+from time import time
+start = time()
+import qbicpwresetd
+print('%f' % (time() - start))
+print(' '.join([m for m in sys.argv[1:] if m in sys.modules]))
+'''
+
+def import_time_test():
+	env = dict(os.environ)
+	env['PYTHONPATH'] = os.pathsep.join(sys.path)
+	out = subprocess.check_output([sys.executable, '-c', check] + lazy_modules, env = env)
+	(elapsed, loaded) = out.splitlines()[-2:]
+	assert loaded.strip() == '', 'imported at startup: %s' % loaded
+	assert float(elapsed) < import_budget, 'import took %ss' % elapsed
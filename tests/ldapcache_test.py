@@ -0,0 +1,67 @@
+import threading
+
+from time import sleep
+from qbic_pwresetd.ldapcache import TTLCache
+
+class CountingLoader(object):
+	def __init__(self, value, delay = 0):
+		self.value = value
+		self.delay = delay
+		self.calls = 0
+
+	def __call__(self):
+		self.calls += 1
+		sleep(self.delay)
+		return self.value
+
+def ttlcache_hit_test():
+	c = TTLCache(10, 60, 60)
+	l = CountingLoader({'mail': ['user@example.org']})
+	assert c.get('k', l) == l.value
+	assert c.get('k', l) == l.value
+	assert l.calls == 1
+	# callers must not be able to change the cached value
+	c.get('k', l)['mail'].append('other@example.org')
+	assert c.get('k', l) == l.value
+	s = c.stats()
+	assert s['hits'] == 3
+	assert s['misses'] == 1
+	assert s['queries_saved'] == 3
+
+def ttlcache_expiry_test():
+	c = TTLCache(10, 60, 0)
+	found = CountingLoader(['user'])
+	not_found = CountingLoader(None)
+	c.get('found', found)
+	c.get('found', found)
+	c.get('missing', not_found)
+	c.get('missing', not_found)
+	assert found.calls == 1
+	# negative_ttl is 0, nothing cached for missing users
+	assert not_found.calls == 2
+	c.invalidate(lambda key: key == 'found')
+	c.get('found', found)
+	assert found.calls == 2
+
+def ttlcache_size_test():
+	c = TTLCache(2, 60, 60)
+	for k in ['a', 'b', 'a', 'c']:
+		c.get(k, CountingLoader(k))
+	assert len(c) == 2
+	# b was the least recently used
+	l = CountingLoader('b')
+	c.get('b', l)
+	assert l.calls == 1
+
+def ttlcache_singleflight_test():
+	c = TTLCache(10, 60, 60)
+	l = CountingLoader('value', delay = 0.2)
+	results = []
+	threads = [threading.Thread(target = lambda: results.append(c.get('k', l))) for i in range(5)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	assert results == ['value'] * 5
+	assert l.calls == 1
+	assert c.stats()['coalesced'] + c.stats()['hits'] == 4
@@ -0,0 +1,54 @@
+from time import time
+from qbic_pwresetd.ldapservers import ServerPool
+
+def pool_primary_test():
+	p = ServerPool(['ldap://a', 'ldap://b'])
+	assert p.primary().uri == 'ldap://a'
+	assert p.primary().primary
+	assert not p.servers[1].primary
+
+def pool_no_uri_test():
+	try:
+		ServerPool([])
+	except ValueError:
+		return
+	assert False
+
+def pool_readers_latency_test():
+	p = ServerPool(['ldap://a', 'ldap://b', 'ldap://c'])
+	(a, b, c) = p.servers
+	p.record_success(a, 0.050)
+	p.record_success(b, 0.010)
+	# c never measured, tried first to get an estimate
+	assert [x.uri for x in p.readers()] == ['ldap://c', 'ldap://b', 'ldap://a']
+	p.record_success(c, 0.020)
+	assert [x.uri for x in p.readers()] == ['ldap://b', 'ldap://c', 'ldap://a']
+	# moving average, one slow answer doesn't swap the order right away
+	p.record_success(b, 0.040)
+	assert abs(b.latency - 0.019) < 1e-9
+	assert p.readers()[0] is b
+
+def pool_ejection_test():
+	p = ServerPool(['ldap://a', 'ldap://b'], eject_time = 30)
+	(a, b) = p.servers
+	assert p.record_failure(a)
+	assert a.ejected_until > time() + 29
+	assert p.readers() == [b]
+	# backoff doubles while failures continue
+	p.record_failure(a)
+	assert a.ejected_until > time() + 59
+	# all down, still something to try, the first one back first
+	p.record_failure(b)
+	assert p.readers() == [b, a]
+	p.record_success(a, 0.010)
+	assert a.failures == 0
+	assert p.readers() == [a]
+
+def pool_max_failures_test():
+	p = ServerPool(['ldap://a'], max_failures = 2, eject_time = 1, max_eject_time = 4)
+	a = p.primary()
+	assert not p.record_failure(a)
+	assert p.readers() == [a]
+	for i in range(5):
+		assert p.record_failure(a)
+	assert a.ejected_until <= time() + 4
@@ -0,0 +1,163 @@
+import os
+import shutil
+import socket
+import threading
+
+from nose.tools import with_setup
+from tempfile import mkdtemp
+
+from qbic_pwresetd.lmtppool import LMTPPool
+
+class LMTPServer(object):
+
+	"""
+	Minimal LMTP server on a UNIX socket, one thread per connection.
+	Recipients in temp_fail get a 451 the first time, the ones in perm_fail
+	always a 550. After drop_after messages every connection is closed
+	once without answering the DATA
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.delivered = []
+		self.connections = 0
+		self.temp_fail = set()
+		self.perm_fail = set()
+		self.drop_after = None
+		self.lock = threading.Lock()
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.bind(path)
+		self.sock.listen(16)
+		t = threading.Thread(target = self.serve)
+		t.daemon = True
+		t.start()
+
+	def serve(self):
+		while True:
+			try:
+				(conn, addr) = self.sock.accept()
+			except socket.error:
+				return
+			with self.lock:
+				self.connections += 1
+			t = threading.Thread(target = self.handle, args = (conn,))
+			t.daemon = True
+			t.start()
+
+	def handle(self, conn):
+		f = conn.makefile('rb')
+		def reply(line):
+			conn.sendall(line + '\r\n')
+		reply('220 localhost LMTP ready')
+		rcpt = []
+		while True:
+			line = f.readline()
+			if line == '':
+				break
+			cmd = line.strip().upper()
+			if cmd.startswith('LHLO'):
+				reply('250-localhost')
+				reply('250 PIPELINING')
+			elif cmd.startswith('MAIL FROM'):
+				rcpt = []
+				reply('250 OK')
+			elif cmd.startswith('RCPT TO'):
+				addr = line.strip()[len('RCPT TO:'):].strip('<>')
+				with self.lock:
+					if addr in self.perm_fail:
+						reply('550 no such user')
+						continue
+					if addr in self.temp_fail:
+						self.temp_fail.discard(addr)
+						reply('451 try again later')
+						continue
+				rcpt.append(addr)
+				reply('250 OK')
+			elif cmd == 'DATA':
+				reply('354 go ahead')
+				data = []
+				while True:
+					l = f.readline()
+					if l in ('.\r\n', ''):
+						break
+					data.append(l)
+				with self.lock:
+					drop = self.drop_after is not None and len(self.delivered) >= self.drop_after
+					if drop:
+						self.drop_after = None
+					else:
+						self.delivered += rcpt
+				if drop:
+					break
+				for r in rcpt:
+					reply('250 OK')
+			elif cmd in ('RSET', 'NOOP'):
+				reply('250 OK')
+			elif cmd == 'QUIT':
+				reply('221 bye')
+				break
+			else:
+				reply('500 unknown command')
+		conn.close()
+
+	def close(self):
+		self.sock.close()
+
+tmpdir = None
+server = None
+
+def setup_server():
+	global tmpdir, server
+	tmpdir = mkdtemp(prefix = 'pwresetd_lmtp_test')
+	server = LMTPServer(os.path.join(tmpdir, 'lmtp.sock'))
+
+def teardown_server():
+	server.close()
+	shutil.rmtree(tmpdir)
+
+def batch(count):
+	return [('secret%d' % i, 'noreply@example.org', ['user%d@example.org' % i], 'Subject: test %d\n\nbody\n' % i) for i in range(count)]
+
+@with_setup(setup_server, teardown_server)
+def parallel_send_test():
+	pool = LMTPPool(server.path, size = 3)
+	res = pool.send(batch(30))
+	assert sorted(res.sent) == sorted(['secret%d' % i for i in range(30)])
+	assert res.failed == []
+	assert res.connects == 3
+	assert len(server.delivered) == 30
+	# connections are kept for the next batch
+	res = pool.send(batch(5))
+	assert len(res.sent) == 5
+	assert res.connects == 0
+	assert server.connections == 3
+	assert pool.stats['sent'] == 35
+	pool.close()
+
+@with_setup(setup_server, teardown_server)
+def retry_test():
+	server.temp_fail.add('user1@example.org')
+	server.perm_fail.add('user2@example.org')
+	server.drop_after = 5
+	pool = LMTPPool(server.path, size = 2, retries = 2)
+	res = pool.send(batch(10))
+	# the permanent failure doesn't stop the rest of the batch
+	assert res.failed == ['secret2']
+	assert sorted(res.sent) == sorted(['secret%d' % i for i in range(10) if i != 2])
+	# one temporary error, one dropped connection
+	assert res.retries == 2
+	assert res.connects == 3
+	pool.close()
+
+@with_setup(setup_server, teardown_server)
+def server_down_test():
+	server.close()
+	os.unlink(server.path)
+	warnings = []
+	pool = LMTPPool(server.path, size = 2, retries = 1, warn = warnings.append)
+	res = pool.send(batch(3))
+	assert sorted(res.failed) == ['secret0', 'secret1', 'secret2']
+	assert res.retries == 3
+	# every attempt failed
+	assert len(warnings) == 6
+	assert all([x.startswith('LMTP connection error delivering secret') for x in warnings])
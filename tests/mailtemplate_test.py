@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+from pytz import timezone, utc
+from random import Random
+
+from qbic_pwresetd.mailtemplate import ExpiryDateFormatter, MessageTemplate
+
+template = '''Dear ${givenname},
+\twe got a request for $username, 100% sure, costs $$0.
+From now on use ${secret} until $expiry_date.
+'''
+
+def random_text(rnd, alphabet):
+	return ''.join([rnd.choice(alphabet) for i in xrange(rnd.randint(0, 40))])
+
+def render_same_as_mimetext_test():
+	rnd = Random(1)
+	alphabet = ['a', 'B', ' ', '\n', 'From ', '%', '$', '\xc3\xa4', ',', '@', '"']
+	tmplts = [MessageTemplate(template, 'noreply@example.org', 'Password reset link for QBiC account'),
+			MessageTemplate('$givenname', 'x' * 90 + '@example.org', 'a very long subject ' * 6)]
+	for t in tmplts:
+		for i in xrange(1000):
+			to = random_text(rnd, ['a', 'b', '.', ' ', ',', '@']) + '@example.org'
+			values = {
+				'givenname': random_text(rnd, alphabet),
+				'username': random_text(rnd, alphabet),
+				'secret': random_text(rnd, alphabet),
+				'expiry_date': random_text(rnd, alphabet),
+			}
+			assert t.render(to, **values) == t.render_mime(to, **values), (to, values)
+	# unicode goes the MIMEText way
+	assert tmplts[1].render(u'user@example.org', givenname = u'Joerg') == tmplts[1].render_mime(u'user@example.org', givenname = u'Joerg')
+
+def invalid_template_test():
+	for bad in ['Dear $', 'Dear $ {name}']:
+		try:
+			MessageTemplate(bad, 'noreply@example.org', 'subject')
+		except ValueError:
+			continue
+		assert False, bad
+	try:
+		MessageTemplate(template, 'noreply@example.org', 'subject').render('u@example.org', givenname = 'John')
+	except KeyError:
+		return
+	assert False
+
+def expiry_date_test():
+	tz = timezone('Europe/Berlin')
+	fmt = '%A %d %B %Y at %H:%M:%S %Z (UTC %z)'
+	f = ExpiryDateFormatter(tz, fmt, cache_size = 50)
+	# a minute at a time across the end of daylight saving time
+	d = datetime(2016, 10, 29, 23, 0, 7)
+	for i in xrange(6 * 60):
+		assert f.format(d) == d.replace(tzinfo = utc).astimezone(tz).strftime(fmt), d
+		d += timedelta(minutes = 1)
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+
+from threading import Thread
+
+from qbic_pwresetd.metrics import Registry, TextfileWriter, backend_call, registry, write_textfile
+
+def counter_test():
+	r = Registry()
+	r.inc('requests_total', command = 'GETREQUEST', status = 'ACK')
+	r.inc('requests_total', 2, status = 'ACK', command = 'GETREQUEST')
+	r.inc('requests_total', command = 'GETREQUEST', status = 'NAK')
+	assert r.counter('requests_total', command = 'GETREQUEST', status = 'ACK') == 3
+	assert r.counter('requests_total', command = 'GETREQUEST', status = 'NAK') == 1
+	assert r.counter('requests_total', command = 'RESETPW', status = 'ACK') == 0
+
+def concurrent_inc_test():
+	r = Registry()
+	def work():
+		for i in xrange(1000):
+			r.inc('n')
+			r.observe('h', 0.01)
+	threads = [Thread(target = work) for i in xrange(4)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	assert r.counter('n') == 4000
+	assert r.histogram('h').count == 4000
+
+def prometheus_text_test():
+	r = Registry()
+	r.inc('pwresetd_commands_total', command = 'STATS', status = 'ACK')
+	r.inc('weird_total', label = 'a "quoted"\\ value\n')
+	for v in [0.0005, 0.001, 0.02, 100]:
+		r.observe('pwresetd_command_duration_seconds', v, command = 'STATS')
+	lines = r.prometheus_text().splitlines()
+	assert '# TYPE pwresetd_commands_total counter' in lines
+	assert 'pwresetd_commands_total{command="STATS",status="ACK"} 1' in lines
+	assert 'weird_total{label="a \\"quoted\\"\\\\ value\\n"} 1' in lines
+	assert '# TYPE pwresetd_command_duration_seconds histogram' in lines
+	# buckets are cumulative, le is inclusive
+	assert 'pwresetd_command_duration_seconds_bucket{command="STATS",le="0.001"} 2' in lines
+	assert 'pwresetd_command_duration_seconds_bucket{command="STATS",le="0.025"} 3' in lines
+	assert 'pwresetd_command_duration_seconds_bucket{command="STATS",le="10.0"} 3' in lines
+	assert 'pwresetd_command_duration_seconds_bucket{command="STATS",le="+Inf"} 4' in lines
+	assert 'pwresetd_command_duration_seconds_count{command="STATS"} 4' in lines
+	assert [x for x in lines if x.startswith('pwresetd_command_duration_seconds_sum{command="STATS"} 100.02')]
+
+def backend_call_test():
+	before = registry.counter('pwresetd_backend_errors_total', backend = 'test', op = 'fail')
+	with backend_call('test', 'ok'):
+		pass
+	try:
+		with backend_call('test', 'fail'):
+			raise IOError('failed')
+	except IOError:
+		pass
+	else:
+		assert False
+	assert registry.histogram('pwresetd_backend_duration_seconds', backend = 'test', op = 'ok').count >= 1
+	assert registry.histogram('pwresetd_backend_duration_seconds', backend = 'test', op = 'fail').count >= 1
+	assert registry.counter('pwresetd_backend_errors_total', backend = 'test', op = 'fail') == before + 1
+
+def textfile_test():
+	tmpdir = tempfile.mkdtemp()
+	try:
+		path = os.path.join(tmpdir, 'pwresetd.prom')
+		r = Registry()
+		r.inc('a_total')
+		write_textfile(path, r)
+		with open(path) as f:
+			assert f.read() == r.prometheus_text()
+		assert os.listdir(tmpdir) == ['pwresetd.prom']
+		r.inc('a_total')
+		w = TextfileWriter(path, 3600, r)
+		w.start()
+		w.stop()
+		with open(path) as f:
+			assert 'a_total 2' in f.read().splitlines()
+		warnings = []
+		w = TextfileWriter(os.path.join(tmpdir, 'missing', 'pwresetd.prom'), 3600, r, warnings.append)
+		w.start()
+		w.stop()
+		assert len(warnings) == 1
+		assert warnings[0].startswith('Failed to write metrics to ')
+	finally:
+		shutil.rmtree(tmpdir)
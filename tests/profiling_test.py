@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+
+from time import sleep
+
+from qbic_pwresetd.profiling import Profiler
+
+def work():
+	return sum([x * x for x in xrange(1000)])
+
+def requests_limit_test():
+	tmpdir = tempfile.mkdtemp()
+	try:
+		p = Profiler(tmpdir)
+		p.start(requests = 2)
+		assert p.running()
+		work()
+		assert p.request_done() is None
+		try:
+			p.start()
+		except RuntimeError:
+			pass
+		else:
+			assert False
+		paths = p.request_done()
+		assert not p.running()
+		assert len(paths) == 2
+		assert sorted(os.listdir(tmpdir)) == sorted([os.path.basename(x) for x in paths])
+		with open(paths[1]) as f:
+			assert 'work' in f.read()
+		# nothing to do once stopped
+		assert p.request_done() is None
+		assert p.stop() == []
+	finally:
+		shutil.rmtree(tmpdir)
+
+def seconds_limit_test():
+	tmpdir = tempfile.mkdtemp()
+	try:
+		p = Profiler(tmpdir)
+		p.start(seconds = 0.05)
+		assert not p.expired()
+		sleep(0.06)
+		assert p.expired()
+		assert len(p.stop()) == 2
+		assert not p.expired()
+	finally:
+		shutil.rmtree(tmpdir)
@@ -1,4 +1,8 @@
-from qbic_pwresetd.pw_check import pwd_score
+import string
+
+from qbic_pwresetd.pw_check import PWQPool, pwd_score, leet_dict, longest_common_substring, remove_leet
+from random import Random
+from threading import Thread
 
 badwords = ['Enrico', 'Tagliavini']
 
@@ -21,3 +25,65 @@ def good_password_test():
 def repeat_for_length_test():
 	assert pwd_score('repeatforlength1111111111111', badwords)[0] == -1
 	assert pwd_score('asdasdasdasdasd', badwords)[0] == -1
+
+# the implementations before the rewrite, the new ones must give the same results
+def reference_remove_leet(word):
+	for l in leet_dict.iterkeys():
+		word = word.replace(l, leet_dict[l])
+	return word
+
+def reference_longest_common_substring(s1, s2):
+	m = [[0] * (1 + len(s2)) for i in xrange(1 + len(s1))]
+	longest, x_longest = 0, 0
+	for x in xrange(1, 1 + len(s1)):
+		for y in xrange(1, 1 + len(s2)):
+			if s1[x - 1] == s2[y - 1]:
+				m[x][y] = m[x - 1][y - 1] + 1
+				if m[x][y] > longest:
+					longest = m[x][y]
+					x_longest = x
+			else:
+				m[x][y] = 0
+	return s1[x_longest - longest: x_longest]
+
+def random_word(rnd, alphabet):
+	return ''.join([rnd.choice(alphabet) for i in xrange(rnd.randint(0, 24))])
+
+def similarity_differential_test():
+	rnd = Random(20161019)
+	# small alphabets give long common substrings, the larger one mostly short ones
+	for alphabet in ['ab', 'abc13', 'aeiost' + ''.join(leet_dict.keys()), string.printable]:
+		for i in xrange(2000):
+			(s1, s2) = (random_word(rnd, alphabet), random_word(rnd, alphabet))
+			assert longest_common_substring(s1, s2) == reference_longest_common_substring(s1, s2), (s1, s2)
+			assert remove_leet(s1) == reference_remove_leet(s1), s1
+			assert remove_leet(unicode(s1)) == reference_remove_leet(unicode(s1)), s1
+			assert type(remove_leet(unicode(s1))) == unicode
+
+def pwq_pool_test():
+	pool = PWQPool(2)
+	with pool.lease() as a:
+		with pool.lease() as b:
+			assert a is not b
+	assert pool.created == 2
+	# contexts are reused, not created again
+	with pool.lease() as c:
+		assert c is a or c is b
+	assert pool.created == 2
+
+def concurrent_score_test():
+	passwords = ['enricotagliavinirocks', '3nr1c0t4gl14v1n1r0cks', 'Fooyeeph7eiw', 'password15', 'doofohGooPh0xohd']
+	users = [badwords, ['Alice', 'Liddell'], ['Foo', 'Yeeph']]
+	cases = [(p, u) for p in passwords for u in users] * 20
+	expected = [pwd_score(p, u) for (p, u) in cases]
+	results = [None] * len(cases)
+	def worker(start):
+		for i in xrange(start, len(cases), 4):
+			results[i] = pwd_score(*cases[i])
+	threads = [Thread(target = worker, args = (x,)) for x in range(4)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	# the bad words of one user must never leak into the check of another
+	assert [x[0] for x in results] == [x[0] for x in expected]
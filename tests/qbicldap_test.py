@@ -0,0 +1,139 @@
+import ldap
+
+from nose.tools import with_setup
+from qbic_pwresetd import config, qbicldap
+from qbic_pwresetd.ldapservers import ServerPool
+from time import time
+
+user_base = 'ou=people,o=example'
+
+class RecordingLDAP(object):
+
+	"""Stands in for the pwadmin connection, records what is asked"""
+
+	def __init__(self, entries, missing_dns = []):
+		self.entries = entries
+		self.missing_dns = missing_dns
+		self.searches = 0
+		self.modified = []
+
+	def search_ext_s(self, base, scope, filterstr = None, attrlist = None):
+		self.searches += 1
+		return self.entries
+
+	def modify_ext_s(self, dn, modlist):
+		if dn in self.missing_dns:
+			raise ldap.NO_SUCH_OBJECT({'desc': 'No such object'})
+		self.modified.append(dn)
+
+def setup_pwadmin():
+	config.testonly = False
+	qbicldap.qbic_user_base = user_base
+	qbicldap.dn_cache.clear()
+
+def teardown_pwadmin():
+	qbicldap.pwadmin_ldap = None
+	qbicldap.dn_cache.clear()
+
+@with_setup(setup_pwadmin, teardown_pwadmin)
+def change_password_cached_dn_test():
+	dn = 'uid=someone,' + user_base
+	conn = RecordingLDAP([(dn, {})])
+	qbicldap.pwadmin_ldap = conn
+	# no DN known yet, must search
+	qbicldap.change_ldap_password('someone', 'new password')
+	assert conn.searches == 1
+	assert conn.modified == [dn]
+	# the reader found the account, no search needed
+	qbicldap._unique_account('someone', [(dn, {'sn': ['One']})])
+	qbicldap.change_ldap_password('someone', 'new password')
+	assert conn.searches == 1
+	assert conn.modified == [dn, dn]
+
+@with_setup(setup_pwadmin, teardown_pwadmin)
+def change_password_stale_dn_test():
+	old_dn = 'uid=someone,ou=old,' + user_base
+	new_dn = 'uid=someone,' + user_base
+	conn = RecordingLDAP([(new_dn, {})], missing_dns = [old_dn])
+	qbicldap.pwadmin_ldap = conn
+	qbicldap._unique_account('someone', [(old_dn, {})])
+	qbicldap.change_ldap_password('someone', 'new password')
+	assert conn.searches == 1
+	assert conn.modified == [new_dn]
+
+@with_setup(setup_pwadmin, teardown_pwadmin)
+def change_password_outside_user_base_test():
+	# DN found by the reader outside qbic_user_base must not be used
+	conn = RecordingLDAP([('uid=someone,' + user_base, {})])
+	qbicldap.pwadmin_ldap = conn
+	qbicldap._unique_account('someone', [('uid=someone,ou=system,o=example', {})])
+	qbicldap.change_ldap_password('someone', 'new password')
+	assert conn.searches == 1
+	assert conn.modified == ['uid=someone,' + user_base]
+
+class DownLDAP(RecordingLDAP):
+
+	def search_ext_s(self, base, scope, filterstr = None, attrlist = None):
+		raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+
+	def unbind_s(self):
+		pass
+
+saved_connect = qbicldap._connect_to_qldap
+saved_servers = qbicldap.ldap_servers
+saved_warn = qbicldap.warn
+
+def setup_servers():
+	qbicldap.ldap_servers = ServerPool(['ldap://down', 'ldap://up'])
+	qbicldap.reader_ldap = None
+
+def teardown_servers():
+	qbicldap._connect_to_qldap = saved_connect
+	qbicldap.warn = saved_warn
+	qbicldap.ldap_servers = saved_servers
+	qbicldap.reader_ldap = None
+	qbicldap.reader_server = None
+
+@with_setup(setup_servers, teardown_servers)
+def search_failover_test():
+	dn = 'uid=someone,' + user_base
+	conns = {'ldap://down': DownLDAP([]), 'ldap://up': RecordingLDAP([(dn, {})])}
+	qbicldap._connect_to_qldap = lambda uri, bind_as_user, password = None: conns[uri]
+	assert qbicldap._search_accounts('uid=someone', ['uid']) == [(dn, {})]
+	(down, up) = qbicldap.ldap_servers.servers
+	assert down.failures == 1
+	assert not down.available(time())
+	assert qbicldap.reader_server is up
+	# the ejected server is not tried again
+	qbicldap._search_accounts('uid=someone', ['uid'])
+	assert conns['ldap://up'].searches == 2
+
+@with_setup(setup_servers, teardown_servers)
+def connect_errors_test():
+	warnings = []
+	qbicldap.warn = warnings.append
+	def connect(uri, bind_as_user, password = None):
+		if uri == 'ldap://down':
+			raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+		raise ldap.INVALID_CREDENTIALS({'desc': 'Invalid credentials'})
+	qbicldap._connect_to_qldap = connect
+	(down, up) = qbicldap.ldap_servers.servers
+	try:
+		qbicldap.connect_reader_ldap()
+		assert False
+	except ldap.INVALID_CREDENTIALS:
+		pass
+	# wrong credentials are not the server's fault
+	assert down.failures == 1
+	assert up.failures == 0
+	assert up.available(time())
+	assert warnings == ['LDAP server ldap://down ejected after 1 consecutive failure(s)']
+	# the primary is back, but not the right credentials
+	qbicldap._connect_to_qldap = lambda uri, bind_as_user, password = None: connect('ldap://up', bind_as_user)
+	try:
+		qbicldap.connect_pwadmin_ldap()
+		assert False
+	except ldap.INVALID_CREDENTIALS:
+		pass
+	assert down.failures == 1
+	assert len(warnings) == 1
@@ -1,13 +1,23 @@
+import os
 import qbicpwresetd
+import shutil
+import signal
+import socket
+import tempfile
 
 from datetime import datetime
+from time import time
 from nose.tools import with_setup
 
 from . import setup_ldap
 from qbic_pwresetd.fakeqbicldap import example_user, change_ldap_password
 from qbic_pwresetd.resetrequest import ResetRequest
-from qbic_pwresetd import config, a_ack, a_nak, a_badrequest, a_error, ArgumentError, BadRequest
-from qbicpwresetd import secret_sanitize_re, create_request, check_and_passwd, enable_request, disable_request
+from qbic_pwresetd.clientprotocol import get_answer, send_request
+from qbic_pwresetd.profiling import Profiler
+from qbic_pwresetd.ratelimit import RateLimiter
+from qbic_pwresetd.signedsecret import SecretSigner
+from qbic_pwresetd import config, a_ack, a_nak, a_badrequest, a_error, max_get_requests, packet_size, ArgumentError, BadRequest
+from qbicpwresetd import secret_sanitize_re, create_request, get_request, check_and_passwd, enable_request, disable_request
 
 import tests
 from tests import account_name, secret, valid_active_secret, valid_inactive_secret, expired_secret, duration, active, creation_timestamp
@@ -164,3 +174,229 @@ def enable_request_test():
 	(sec, enabled) = answer
 	assert sec == secret
 	assert enabled == False
+
+@with_setup(setup_db, teardown_db)
+def secret_filter_test():
+	qbicpwresetd.load_secret_filter(100)
+	try:
+		assert len(qbicpwresetd.secret_filter) == len(dbmanager.list_requests())
+		assert qbicpwresetd.db_get_request(valid_active_secret) is not None
+		assert qbicpwresetd.db_get_request('no such sec exists') is None
+	finally:
+		qbicpwresetd.secret_filter = None
+
+@with_setup(setup_ldap_and_db, teardown_db)
+def get_request_test():
+	(status, reqs) = get_request(None, 'username=' + example_user['uid'][0])
+	assert status == a_ack
+	assert len(reqs) == 3
+	assert set([valid_active_secret, valid_inactive_secret, expired_secret]) == set([x.secret_code for x in reqs])
+	(status, reqs) = get_request(None, 'email=' + example_user['mail'][0])
+	assert status == a_ack
+	assert len(reqs) == 3
+	(status, reqs) = get_request(None, 'secret=' + secret)
+	assert status == a_ack
+	assert len(reqs) == 1
+	assert reqs[0].account_name == account_name
+	for selector in ['username=nosuchuser', 'email=user@example.org', 'secret=nosuchsecret']:
+		assert get_request(None, selector)[0] == a_nak
+	# LDAP filter wildcards and syntax are matched literally
+	for selector in ['username=*', 'email=*', 'email=*@uni-tuebingen.de', 'email=*)(uid=*']:
+		assert get_request(None, selector)[0] == a_nak
+
+@with_setup(setup_ldap_and_db, teardown_db)
+def get_request_wildcard_email_test():
+	(server, client) = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		send_request(client, 'GETREQUEST', ['email=*'])
+		send_request(client, 'KTHXBYE', [])
+		qbicpwresetd.handle_connection(server)
+		assert get_answer(client, 'GETREQUEST')[0] == a_nak
+	finally:
+		server.close()
+		client.close()
+
+@with_setup(setup_ldap_and_db, teardown_db)
+def get_request_many_test():
+	uid = example_user['uid'][0]
+	secrets = ['%s%03d' % ('x' * 117, i) for i in range(2 * max_get_requests)]
+	for s in secrets:
+		dbmanager.add_request(ResetRequest(uid, s, 48, True))
+	(server, client) = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		send_request(client, 'GETREQUEST', ['username=' + uid])
+		send_request(client, 'KTHXBYE', [])
+		qbicpwresetd.handle_connection(server)
+		(status, reqs) = get_answer(client, 'GETREQUEST')
+		assert status == a_ack
+		# more than the default 4 packets
+		assert sum(len(x.pack()) for x in reqs) > 4 * packet_size
+		# the newest ones, oldest first
+		assert [x.secret_code for x in reqs] == secrets[-max_get_requests:]
+	finally:
+		server.close()
+		client.close()
+
+@with_setup(setup_ldap_and_db, teardown_db)
+def get_request_long_secrets_test():
+	uid = example_user['uid'][0]
+	# as long as CREATEREQUEST lets them be
+	secrets = ['%s%03d' % ('x' * 3997, i) for i in range(max_get_requests)]
+	for s in secrets:
+		dbmanager.add_request(ResetRequest(uid, s, 48, True))
+	(server, client) = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		send_request(client, 'GETREQUEST', ['username=' + uid])
+		send_request(client, 'KTHXBYE', [])
+		qbicpwresetd.handle_connection(server)
+		(status, reqs) = get_answer(client, 'GETREQUEST')
+		assert status == a_ack
+		# the newest ones fitting in the answer
+		assert 0 < len(reqs) < max_get_requests
+		assert [x.secret_code for x in reqs] == secrets[-len(reqs):]
+	finally:
+		server.close()
+		client.close()
+
+@with_setup(setup_ldap_and_db, teardown_db)
+def stats_test():
+	(server, client) = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		send_request(client, 'GETREQUEST', ['secret=nosuchsecret'])
+		send_request(client, 'STATS', [])
+		send_request(client, 'KTHXBYE', [])
+		qbicpwresetd.handle_connection(server)
+		assert get_answer(client, 'GETREQUEST')[0] == a_nak
+		(status, answer) = get_answer(client, 'STATS')
+		assert status == a_ack
+		lines = answer.splitlines()
+		assert [x for x in lines if x.startswith('pwresetd_commands_total{command="GETREQUEST",status="NAK"} ')]
+		assert [x for x in lines if x.startswith('pwresetd_command_duration_seconds_count{command="GETREQUEST"} ')]
+		assert [x for x in lines if x.startswith('pwresetd_backend_duration_seconds_count{backend="db",op="get_request"} ')]
+	finally:
+		server.close()
+		client.close()
+
+def profile_command_test():
+	tmpdir = tempfile.mkdtemp()
+	qbicpwresetd.profiler = None
+	try:
+		assert qbicpwresetd.profile_command(None, 'STATUS', 0, 0, False)[0] == a_nak
+		qbicpwresetd.profiler = Profiler(tmpdir)
+		assert qbicpwresetd.profile_command(None, 'STOP', 0, 0, False)[0] == a_nak
+		assert qbicpwresetd.profile_command(None, 'START', 0, 1, False)[0] == a_ack
+		assert qbicpwresetd.profile_command(None, 'START', 0, 1, False)[0] == a_nak
+		assert qbicpwresetd.profile_command(None, 'STATUS', 0, 0, False) == (a_ack, 'running')
+		# the limit of one request is reached
+		qbicpwresetd.profile_request_done()
+		assert qbicpwresetd.profile_command(None, 'STATUS', 0, 0, False) == (a_ack, 'stopped')
+		assert len(os.listdir(tmpdir)) == 2
+	finally:
+		qbicpwresetd.profiler = None
+		shutil.rmtree(tmpdir)
+
+@with_setup(setup_ldap_and_db, teardown_db)
+def profile_signal_test():
+	tmpdir = tempfile.mkdtemp()
+	qbicpwresetd.profiler = Profiler(tmpdir)
+	old_handler = signal.signal(signal.SIGUSR2, qbicpwresetd.profile_signal_handler)
+	db_get_request = qbicpwresetd.db_get_request
+	def signal_meanwhile(secret):
+		os.kill(os.getpid(), signal.SIGUSR2)
+		return db_get_request(secret)
+	qbicpwresetd.db_get_request = signal_meanwhile
+	(server, client) = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		send_request(client, 'GETREQUEST', ['secret=' + secret])
+		send_request(client, 'KTHXBYE', [])
+		qbicpwresetd.handle_connection(server)
+		assert get_answer(client, 'GETREQUEST')[0] == a_ack
+		# nothing done in the middle of the request
+		assert qbicpwresetd.profile_toggle_requested
+		assert not qbicpwresetd.profiler.running()
+		qbicpwresetd.handle_profile_signals()
+		assert not qbicpwresetd.profile_toggle_requested
+		assert qbicpwresetd.profiler.running()
+		os.kill(os.getpid(), signal.SIGUSR2)
+		qbicpwresetd.handle_profile_signals()
+		assert not qbicpwresetd.profiler.running()
+		assert len(os.listdir(tmpdir)) == 2
+	finally:
+		signal.alarm(0)
+		signal.signal(signal.SIGUSR2, old_handler)
+		qbicpwresetd.db_get_request = db_get_request
+		qbicpwresetd.profiler = None
+		qbicpwresetd.profile_toggle_requested = False
+		qbicpwresetd.profile_alarm = False
+		server.close()
+		client.close()
+		shutil.rmtree(tmpdir)
+
+@with_setup(setup_ldap_and_db, teardown_db)
+def warm_up_test():
+	assert qbicpwresetd.warm_up()
+	# nothing left for the steps
+	qbicpwresetd.warmup_timeout = 0
+	try:
+		assert not qbicpwresetd.warm_up()
+	finally:
+		qbicpwresetd.warmup_timeout = 10
+
+def rate_limited_test():
+	old = qbicpwresetd.rate_limiter
+	qbicpwresetd.rate_limiter = RateLimiter({('RESETPW', 'account'): (1, 60)})
+	try:
+		args = ['user', 'secret', 'newpassword']
+		assert qbicpwresetd.rate_limited('RESETPW', args, (1000, 1)) is None
+		assert qbicpwresetd.rate_limited('RESETPW', args, (1000, 2))[0] == a_nak
+		assert qbicpwresetd.rate_limited('RESETPW', ['other'] + args[1:], (1000, 1)) is None
+	finally:
+		qbicpwresetd.rate_limiter = old
+
+@with_setup(setup_ldap_and_db, teardown_db)
+def signed_secret_test():
+	qbicpwresetd.secret_signer = SecretSigner([('k1', 'k' * 32)])
+	try:
+		config.testonly = False
+		(status, secret) = create_request(None, 'username=' + example_user['uid'][0], 'autogenerate', duration, True)
+		assert status == a_ack
+		assert qbicpwresetd.precheck_secret(secret) is None
+		assert get_request(None, 'secret=' + secret)[0] == a_ack
+		forged = secret[:-1] + ('0' if secret[-1] != '0' else '1')
+		assert qbicpwresetd.precheck_secret(forged) == 'forged'
+		assert get_request(None, 'secret=' + forged)[0] == a_nak
+		# the unsigned ones still go to the database
+		assert qbicpwresetd.precheck_secret(valid_active_secret) is None
+		# an expired one tells nothing about the account, no early answer
+		expired = qbicpwresetd.secret_signer.sign(time() - 10, '0' * 32)
+		assert qbicpwresetd.precheck_secret(expired) == 'expired'
+		delay = qbicpwresetd.invalid_credential_delay
+		qbicpwresetd.invalid_credential_delay = 0.1
+		start = time()
+		try:
+			check_and_passwd(None, 'nosuchuser', expired, 'doofohGooPh0xohd')
+			assert False
+		except ArgumentError as e:
+			assert e.client_message() == 'Invalid credentials'
+		assert time() - start >= 0.1
+		qbicpwresetd.invalid_credential_delay = delay
+		qbicpwresetd.signed_secrets_only = True
+		assert qbicpwresetd.precheck_secret(valid_active_secret) == 'unsigned'
+	finally:
+		config.testonly = True
+		qbicpwresetd.secret_signer = None
+		qbicpwresetd.signed_secrets_only = False
+
+@with_setup(setup_ldap_and_db, teardown_db)
+def socket_commands_test():
+	(server, client) = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		send_request(client, 'STATS', [])
+		send_request(client, 'GETREQUEST', ['secret=nosuchsecret'])
+		send_request(client, 'KTHXBYE', [])
+		qbicpwresetd.handle_connection(server, None, frozenset(['GETREQUEST', 'RESETPW']))
+		assert get_answer(client, 'STATS') == (a_nak, 'Command not allowed on this socket')
+		assert get_answer(client, 'GETREQUEST')[0] == a_nak
+	finally:
+		server.close()
+		client.close()
@@ -0,0 +1,90 @@
+import logging
+
+from Queue import Queue
+
+from qbic_pwresetd.metrics import registry
+from qbic_pwresetd.queuelog import LogContext, QueueHandler, QueueListener
+
+class ListHandler(logging.Handler):
+
+	def __init__(self):
+		logging.Handler.__init__(self)
+		self.setFormatter(logging.Formatter('%(prefix)s%(message)s'))
+		self.lines = []
+
+	def emit(self, record):
+		self.lines.append(self.format(record))
+
+class Lazy(object):
+
+	def __init__(self):
+		self.formatted = 0
+
+	def __str__(self):
+		self.formatted += 1
+		return 'lazy'
+
+def _logger(name, handler):
+	l = logging.getLogger(name)
+	l.propagate = False
+	l.setLevel(logging.DEBUG)
+	for h in l.handlers[:]:
+		l.removeHandler(h)
+	l.addHandler(handler)
+	return l
+
+def queued_logging_test():
+	q = Queue(100)
+	context = LogContext()
+	out = ListHandler()
+	listener = QueueListener(q, [('queuelog_test', [out])])
+	l = _logger('queuelog_test', QueueHandler(q))
+	l.addFilter(context)
+	lazy = Lazy()
+	context.prefix = '[client 0]: '
+	l.info('value %s', lazy)
+	context.prefix = ''
+	l.info('no prefix, 100%')
+	# nothing is formatted until the listener writes it
+	assert lazy.formatted == 0
+	listener.start()
+	listener.stop()
+	assert out.lines == ['[client 0]: value lazy', 'no prefix, 100%']
+	assert lazy.formatted == 1
+
+def drop_test():
+	q = Queue(2)
+	out = ListHandler()
+	handler = QueueHandler(q)
+	l = _logger('queuelog_drop_test', handler)
+	l.addFilter(LogContext())
+	before = registry.counter('pwresetd_log_dropped_total')
+	for i in xrange(5):
+		l.warning('message %d', i)
+	assert handler.dropped == 3
+	assert registry.counter('pwresetd_log_dropped_total') == before + 3
+	listener = QueueListener(q, [('queuelog_drop_test', [out])])
+	listener.start()
+	listener.stop()
+	l.warning('message 5')
+	listener.start()
+	listener.stop()
+	assert out.lines == ['message 0', 'message 1', '3 log message(s) dropped, the log queue was full', 'message 5']
+
+def limit_test():
+	q = Queue()
+	handler = QueueHandler(q, 4)
+	l = _logger('queuelog_limit_test', handler)
+	l.addFilter(LogContext())
+	for i in xrange(3):
+		l.warning('message %d', i)
+	# smaller than what is queued already
+	handler.limit = 2
+	l.warning('message 3')
+	assert handler.dropped == 1
+	assert q.qsize() == 3
+	handler.limit = 5
+	l.warning('message 4')
+	assert handler.dropped == 1
+	# the warning about the dropped one and message 4
+	assert q.qsize() == 5
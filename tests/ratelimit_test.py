@@ -0,0 +1,44 @@
+from nose.tools import assert_raises
+
+from qbic_pwresetd.ratelimit import RateLimiter, TokenBuckets, parse_limit
+
+def parse_limit_test():
+	assert parse_limit('5/60') == (5, 60.0)
+	for bad in ['5', '5/0', '0/60', 'five/60', '-1/60']:
+		assert_raises(ValueError, parse_limit, bad)
+
+def token_buckets_test():
+	b = TokenBuckets(2, 10)
+	assert b.allow('a', 0)
+	assert b.allow('a', 0)
+	assert not b.allow('a', 0)
+	# other keys have their own bucket
+	assert b.allow('b', 0)
+	# one token back every 5 seconds
+	assert not b.allow('a', 4)
+	assert len(b) == 2
+	assert b.allow('a', 5)
+	assert not b.allow('a', 5)
+	# b is full again, forgotten when a is used
+	assert len(b) == 1
+
+def max_keys_test():
+	b = TokenBuckets(1, 100, max_keys = 2)
+	for k in ['a', 'b', 'c']:
+		assert b.allow(k, 0)
+	assert len(b) == 2
+	# a was the oldest, it got forgotten
+	assert b.allow('a', 0)
+	assert not b.allow('c', 0)
+
+def rate_limiter_test():
+	rl = RateLimiter({('RESETPW', 'account'): (1, 60), ('RESETPW', 'peer'): (2, 60)})
+	assert rl.check('RESETPW', (1000, 1), 'username=u1', 0) is None
+	assert rl.check('RESETPW', (1000, 1), 'username=u1', 0) == 'account'
+	assert rl.check('RESETPW', (1000, 1), 'username=u2', 0) is None
+	assert rl.check('RESETPW', (1000, 1), 'username=u3', 0) == 'peer'
+	# refused requests take no tokens
+	assert rl.check('RESETPW', (1000, 2), 'username=u3', 0) is None
+	# not limited
+	for i in range(10):
+		assert rl.check('CREATEREQUEST', (1000, 1), 'username=u1', 0) is None
@@ -0,0 +1,101 @@
+import os
+import qbicpwresetd
+import shutil
+import tempfile
+
+from qbic_pwresetd import qbicldap
+
+from . import setup_ldap
+
+cfg_path = os.path.join(os.path.dirname(__file__), '..', 'cfg', 'qbic-ldap-pwd-resetd.ini')
+saved = ['current_config', 'authorized_users', 'pwd_min_score', 'invalid_credential_delay', 'max_duration',
+		'msg_templates', 'lmtp_pool', 'secret_filter', 'config_file']
+
+def write_config(path, **changes):
+	lines = []
+	with open(cfg_path) as f:
+		for l in f:
+			key = l.split('=', 1)[0].strip()
+			if key in changes:
+				l = '%s = %s\n' % (key, changes[key])
+			lines.append(l)
+	with open(path, 'w') as f:
+		f.write(''.join(lines))
+	return
+
+def reload_test():
+	tmpdir = tempfile.mkdtemp()
+	old = dict([(x, getattr(qbicpwresetd, x)) for x in saved])
+	old_depth = qbicpwresetd.admission.depth
+	old_log_limit = qbicpwresetd.queue_handler.limit
+	try:
+		path = os.path.join(tmpdir, 'pwresetd.ini')
+		base = {
+			'authorized_users': 'root',
+			'qbic_ldap_uri': qbicldap.fake_ldap_uri,
+			'uri': 'sqlite://' + os.path.join(tmpdir, 'db.sqlite'),
+		}
+		write_config(path, **base)
+		qbicpwresetd.config_file = path
+		qbicpwresetd.validate_config(qbicpwresetd.read_config(path))
+		assert qbicpwresetd.pwd_min_score == 12
+		assert qbicpwresetd.authorized_users == [0]
+		pool = qbicpwresetd.lmtp_pool
+		cache = qbicldap.account_cache
+		assert cache is not None
+
+		# only what changed is rebuilt
+		write_config(path, min_score = 15, invalid_credential_delay = 0, **base)
+		assert qbicpwresetd.reload_config()
+		assert qbicpwresetd.pwd_min_score == 15
+		assert qbicpwresetd.invalid_credential_delay == 0
+		assert qbicpwresetd.lmtp_pool is pool
+		assert qbicldap.account_cache is cache
+		write_config(path, min_score = 15, lmtp_connections = 3, cache_ttl = 30, **base)
+		assert qbicpwresetd.reload_config()
+		assert qbicpwresetd.lmtp_pool is not pool
+		assert qbicpwresetd.lmtp_pool.size == 3
+		assert qbicldap.account_cache is not cache
+
+		# smaller queues apply to what is queued next
+		write_config(path, min_score = 15, admission_queue = 2, log_queue_size = 5, **base)
+		assert qbicpwresetd.reload_config()
+		assert qbicpwresetd.admission.depth == 2
+		assert qbicpwresetd.queue_handler.limit == 5
+
+		# a broken config changes nothing
+		snapshot = qbicpwresetd.current_config
+		for broken in [{'min_score': 'many'}, {'authorized_users': 'no-such-user-here'},
+				{'default_reset_msg': 'Dear ${givenname} $nosuchplaceholder'},
+				{'breached_passwords_index': os.path.join(tmpdir, 'missing.idx')}]:
+			changes = dict(base)
+			changes.update(broken)
+			write_config(path, **changes)
+			assert not qbicpwresetd.reload_config()
+			assert qbicpwresetd.current_config is snapshot
+			assert qbicpwresetd.pwd_min_score == 15
+			assert qbicpwresetd.authorized_users == [0]
+	finally:
+		qbicpwresetd.lmtp_pool.close()
+		qbicpwresetd.watchdog.stop()
+		qbicpwresetd.admission.set_depth(old_depth)
+		qbicpwresetd.queue_handler.limit = old_log_limit
+		for (k, v) in old.iteritems():
+			setattr(qbicpwresetd, k, v)
+		qbicldap.init_ldap_cache(0, 0, 0)
+		setup_ldap()
+		shutil.rmtree(tmpdir)
+
+def check_config_test():
+	tmpdir = tempfile.mkdtemp()
+	try:
+		path = os.path.join(tmpdir, 'pwresetd.ini')
+		write_config(path, authorized_users = 'root', uri = 'sqlite://' + os.path.join(tmpdir, 'db.sqlite'))
+		assert qbicpwresetd.check_config(path) == 0
+		# nothing was connected or created
+		assert os.listdir(tmpdir) == ['pwresetd.ini']
+		write_config(path, authorized_users = 'root', uri = 'oracle://db')
+		assert qbicpwresetd.check_config(path) == qbicpwresetd.EXIT_NOTCONFIGURED
+		assert qbicpwresetd.check_config(os.path.join(tmpdir, 'missing.ini')) == qbicpwresetd.EXIT_NOTCONFIGURED
+	finally:
+		shutil.rmtree(tmpdir)
@@ -9,7 +9,7 @@ from qbic_pwresetd.fakeqbicldap import example_user
 from qbic_pwresetd.resetrequest import ResetRequest, DBManager
 
 import tests
-from tests import account_name, secret, duration, active, creation_timestamp
+from tests import account_name, secret, valid_inactive_secret, expired_secret, duration, active, creation_timestamp
 
 # the safe-net testonly option for the main module must be disabled
 # or all changes to the DB will be rolled back.
@@ -171,3 +171,21 @@ def update_request_by_secret_test():
 	assert dbmanager.update_request_by_secret(secret, 'is_active', True) == 1
 	# disable it again
 	assert dbmanager.update_request_by_secret(secret, 'is_active', False) == 1
+
+@with_setup(setup_db, teardown_db)
+def list_secrets_test():
+	secrets = list(dbmanager.list_secrets(batch_size = 1))
+	assert secret in secrets
+	assert len(secrets) == len(dbmanager.list_requests())
+
+@with_setup(setup_db, teardown_db)
+def get_requests_by_account_test():
+	l = dbmanager.get_requests_by_account([account_name])
+	assert len(l) == 1
+	assert l[0].secret_code == secret
+	l = dbmanager.get_requests_by_account([account_name, example_user['uid'][0]])
+	assert len(l) == 4
+	assert dbmanager.get_requests_by_account(['nosuchuser']) == []
+	assert dbmanager.get_requests_by_account([]) == []
+	l = dbmanager.get_requests_by_account([example_user['uid'][0]], 2)
+	assert [x.secret_code for x in l] == [valid_inactive_secret, expired_secret]
@@ -0,0 +1,27 @@
+from qbic_pwresetd.secretfilter import SecretFilter
+
+def secretfilter_test():
+	sf = SecretFilter(1000, 0.01)
+	secrets = ['secret%d' % i for i in range(1000)]
+	for s in secrets:
+		sf.add(s)
+	assert len(sf) == 1000
+	assert not sf.saturated()
+	# no false negatives
+	for s in secrets:
+		assert s in sf
+	# false positives should be close to the configured rate
+	fp = len([1 for i in range(10000) if 'unknown%d' % i in sf])
+	assert fp < 10000 * 0.02
+	assert sf.false_positive_rate() < 0.02
+	sf.add('onetoomany')
+	assert sf.saturated()
+
+def secretfilter_invalid_test():
+	for args in [(0, 0.01), (10, 0), (10, 1)]:
+		try:
+			SecretFilter(*args)
+		except ValueError:
+			pass
+		else:
+			assert False
@@ -1,7 +1,8 @@
 from base64 import standard_b64encode, standard_b64decode
 
-from qbic_pwresetd.serverprotocol import _parse_create_request, _parse_reset_password
-from qbic_pwresetd import crta_t, BadRequest
+from qbic_pwresetd.resetrequest import ResetRequest
+from qbic_pwresetd.serverprotocol import _answer_list_requests, _parse_create_request, _parse_get_request, _parse_profile, _parse_reset_password, fit_list_requests
+from qbic_pwresetd import a_ack, crta_t, packet_header_t, packet_size, BadRequest
 
 def _test_parser(p_funct, args, results):
 	print('Testing \'%s\' with args %s. Expected result is %s' % (p_funct.__name__, repr(args), repr(results)))
@@ -55,3 +56,41 @@ def parse_reset_password_test():
 	]
 	for (arg, res) in t_error_battery:
 		_test_parser_error(_parse_reset_password, arg, res)
+
+def parse_get_request_test():
+	t_battery = [
+		(['username=someone'], ('username=someone',)),
+		(['email=' + standard_b64encode('user@example.com')], ('email=user@example.com',)),
+		(['secret=secret'], ('secret=secret',)),
+		# same characters as CREATEREQUEST always allowed
+		(['secret=a/b=c@d:e'], ('secret=a/b=c@d:e',)),
+	]
+	for (arg, res) in t_battery:
+		_test_parser(_parse_get_request, arg, res)
+
+	t_error_battery = [
+		(['someone'], BadRequest),
+		(['username='], BadRequest),
+		(['user=someone'], BadRequest),
+		(['email=someone@example.org'], BadRequest),
+		(['secret=secret!'], BadRequest),
+	]
+	for (arg, res) in t_error_battery:
+		_test_parser_error(_parse_get_request, arg, res)
+
+def parse_profile_test():
+	_test_parser(_parse_profile, ['START', '30', '0', '1'], ['START', 30, 0, True])
+	_test_parser(_parse_profile, ['stop'], ['STOP', 0, 0, False])
+	_test_parser(_parse_profile, ['STATUS'], ['STATUS', 0, 0, False])
+	for args in [['START'], ['START', 'a', '0', '0'], ['START', '-1', '0', '0'], ['STOP', '1'], ['RESTART']]:
+		_test_parser_error(_parse_profile, args, BadRequest)
+
+def fit_list_requests_test():
+	requests = [ResetRequest('someone', 's' * 300 + str(i)) for i in range(10)]
+	fitted = fit_list_requests(requests, 2)
+	assert fitted == requests[-len(fitted):]
+	assert len(packet_header_t.pack(1, 0) + _answer_list_requests(a_ack, fitted)) <= 2 * packet_size
+	one_more = requests[-len(fitted) - 1:]
+	assert len(packet_header_t.pack(1, 0) + _answer_list_requests(a_ack, one_more)) > 2 * packet_size
+	assert fit_list_requests(requests, 16) == requests
+	assert fit_list_requests([], 16) == []
@@ -0,0 +1,47 @@
+import os
+import tempfile
+
+from nose.tools import assert_raises
+
+from qbic_pwresetd.signedsecret import SecretSigner, load_keys, looks_signed
+from qbicpwresetd import secret_sanitize_re
+
+key1 = 'a' * 64
+key2 = 'b' * 64
+random = '0123456789abcdef' * 2
+
+def sign_and_check_test():
+	signer = SecretSigner([('k1', key1)])
+	secret = signer.sign(1000, random)
+	assert looks_signed(secret)
+	assert secret_sanitize_re.search(secret) is None
+	assert signer.check(secret, 999) is None
+	assert signer.check(secret, 1000) == 'expired'
+	# a later expiry doesn't match the MAC
+	(kid, expiry, r, mac) = secret.split('.')
+	assert signer.check('.'.join([kid, '%08x' % 2000, r, mac]), 999) == 'forged'
+	assert signer.check('k2.' + secret[3:], 999) == 'unknown_key'
+	assert signer.check('f' * 64, 999) == 'malformed'
+	assert not looks_signed('f' * 64)
+
+def rotation_test():
+	old = SecretSigner([('k1', key1)])
+	new = SecretSigner([('k2', key2), ('k1', key1)])
+	secret = old.sign(1000, random)
+	assert new.check(secret, 0) is None
+	assert new.sign(1000, random).startswith('k2.')
+	# same id, different key
+	assert SecretSigner([('k1', key2)]).check(secret, 0) == 'forged'
+
+def load_keys_test():
+	(fd, path) = tempfile.mkstemp()
+	try:
+		with os.fdopen(fd, 'w') as f:
+			f.write('# newest first\nk2 %s\n\nk1 %s\n' % (key2, key1))
+		assert load_keys(path) == [('k2', key2), ('k1', key1)]
+		for bad in ['', 'k1\n', 'k1 short\n', 'k.1 %s\n' % key1, 'k1 %s\nk1 %s\n' % (key1, key2)]:
+			with open(path, 'w') as f:
+				f.write(bad)
+			assert_raises(ValueError, load_keys, path)
+	finally:
+		os.unlink(path)
@@ -0,0 +1,60 @@
+from threading import Thread
+from time import sleep
+
+from qbic_pwresetd import tracing
+from qbic_pwresetd.metrics import backend_call
+from qbic_pwresetd.tracing import span
+
+def disabled_test():
+	tracing.enabled = False
+	assert tracing.start('RESETPW') is None
+	assert span('db', 'get_request') is tracing._null_span
+	with span('pwd_score'):
+		pass
+	assert tracing.finish() is None
+
+def breakdown_test():
+	tracing.enabled = True
+	try:
+		t = tracing.start('SENDEMAIL')
+		for i in xrange(3):
+			with span('get_request'):
+				with backend_call('db', 'get_request'):
+					pass
+		with span('delay'):
+			sleep(0.05)
+		try:
+			with span('send_emails'):
+				raise ValueError
+		except ValueError:
+			pass
+		assert tracing.finish() is t
+		assert tracing.finish() is None
+	finally:
+		tracing.enabled = False
+	assert t.order == ['get_request/db:get_request', 'get_request', 'delay', 'send_emails']
+	assert t.phases['get_request'][1] == 3
+	assert t.phases['delay'][0] >= 0.05
+	assert t.total() >= t.traced >= 0.05
+	line = t.breakdown()
+	assert line.startswith('SENDEMAIL total=')
+	assert ' get_request/db:get_request=' in line and ' get_request=' in line
+	assert '/3 ' in line
+	assert ' untraced=' in line
+
+def thread_test():
+	tracing.enabled = True
+	try:
+		t = tracing.start('RESETPW')
+		other = []
+		def work():
+			other.append(span('lmtp', 'send'))
+		th = Thread(target = work)
+		th.start()
+		th.join()
+		tracing.finish()
+	finally:
+		tracing.enabled = False
+	# spans of other threads don't end up in the trace
+	assert other == [tracing._null_span]
+	assert t.order == []
@@ -0,0 +1,49 @@
+import os
+
+from time import sleep
+
+from qbic_pwresetd.metrics import registry as metrics
+from qbic_pwresetd.watchdog import Watchdog, watchdog_timeout
+
+def watchdog_timeout_test():
+	assert watchdog_timeout({}) is None
+	assert watchdog_timeout({'WATCHDOG_USEC': '60000000'}) == 60.0
+	assert watchdog_timeout({'WATCHDOG_USEC': '60000000', 'WATCHDOG_PID': str(os.getpid())}) == 60.0
+	# meant for another process
+	assert watchdog_timeout({'WATCHDOG_USEC': '60000000', 'WATCHDOG_PID': str(os.getpid() + 1)}) is None
+
+def beat_test():
+	sent = []
+	wd = Watchdog(sent.append, 60)
+	assert wd.interval == 30
+	wd.beat()
+	assert sent[0].startswith('WATCHDOG=1\nSTATUS=')
+	# not again so soon
+	wd.busy('testing')
+	wd.beat()
+	assert len(sent) == 1
+	assert wd.busy_since is None
+	# no watchdog, no pings
+	sent = []
+	wd = Watchdog(sent.append)
+	wd.beat()
+	assert sent == []
+
+def stall_test():
+	sent = []
+	warnings = []
+	metrics.clear()
+	wd = Watchdog(sent.append, stall_threshold = 0.1, warn = warnings.append)
+	wd.start()
+	try:
+		wd.busy('testing')
+		sleep(0.3)
+		# reported once, without pinging
+		assert metrics.counter('pwresetd_loop_stalls_total') == 1
+		assert len(sent) == 1
+		assert sent[0].startswith('STATUS=Main loop stalled for ')
+		wd.beat()
+		assert sent[1].startswith('STATUS=Accepting connections')
+		assert len(warnings) == 2
+	finally:
+		wd.stop()